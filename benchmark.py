@@ -0,0 +1,239 @@
+'''
+Benchmarks of the engine and the players, printed as JSON to compare commits.
+
+Everything runs over the same corpus of positions, reached by seeded random play from
+the empty board, so two runs with the same arguments measure the same work. The corpus
+leaves out the positions where the player to move wins in one move, which a search
+settles at depth 1 whatever the depth asked:
+
+- operations: calls per second of Game.apply (a move, taken back with undo),
+  Game.check_winner, get_possible_moves and evaluate_board
+- minimax: nodes per second of main.minimax at fixed depths, a node being one call or
+  one child of a frontier scored without being played, as counted by its stats
+- alphabeta: nodes per second of AlphaBetaSearch at fixed depths, after an untimed
+  search of every position, with the tables allocated before the timing starts
+- mcts: playouts per second of the monte-carlo.py player, and of the bare playout kernel
+- memory: peak bytes allocated by one search of each player, measured with tracemalloc
+  in separate runs so it does not slow the timings
+
+    python benchmark.py --positions 100 --seed 0 > before.json
+'''
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+import bitboard
+import main
+from evaluation import evaluate_board
+from game import Game
+from movegen import MOVES, get_possible_moves, legal_move_ids
+from playout import playout
+from search import AlphaBetaSearch
+from stats import Stats
+from tournament import make_player
+
+
+def corpus(count: int, seed: int = 0, max_plies: int = 40) -> list[tuple[int, int, int]]:
+    '''
+    Returns count (board0, board1, to_move) positions after random legal plies, without a winner
+    and without a winning move for the player to move.
+    '''
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board0, board1, to_move = 0, 0, 0
+        for _ in range(rng.randrange(max_plies)):
+            bitboards = [board0, board1]
+            move_id = rng.choice(legal_move_ids(bitboards[1 - to_move]))
+            bitboards[to_move], bitboards[1 - to_move] = bitboard.apply_move(
+                bitboards[to_move], bitboards[1 - to_move], move_id
+            )
+            if bitboard.winner(bitboards[0], bitboards[1], to_move) != -1:
+                break
+            board0, board1, to_move = bitboards[0], bitboards[1], 1 - to_move
+        if not _wins_in_one(board0, board1, to_move):
+            positions.append((board0, board1, to_move))
+    return positions
+
+
+def _wins_in_one(board0: int, board1: int, to_move: int) -> bool:
+    '''Whether to_move has a move that wins the game'''
+    bitboards = [board0, board1]
+    for move_id in legal_move_ids(bitboards[1 - to_move]):
+        after = list(bitboards)
+        after[to_move], after[1 - to_move] = bitboard.apply_move(bitboards[to_move], bitboards[1 - to_move], move_id)
+        if bitboard.winner(after[0], after[1], to_move) == to_move:
+            return True
+    return False
+
+
+def _rate(function, cases: list, min_time: float) -> float:
+    '''Calls function on every case, as many passes as fit in min_time, and returns the calls per second'''
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for case in cases:
+            function(*case)
+        calls += len(cases)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return calls / elapsed
+
+
+def _peak_memory(function, *args) -> int:
+    '''Peak bytes allocated while function runs'''
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_operations(positions: list[tuple[int, int, int]], min_time: float) -> dict:
+    games = [(Game.from_position(*position),) for position in positions]
+    moves = [
+        (game, MOVES[move_id])
+        for (game,) in games
+        for move_id in legal_move_ids(game.get_bitboards()[1 - game.get_current_player()])
+    ]
+    boards = [(game.get_board(), game.get_current_player()) for (game,) in games]
+    # the player who is not to move made the last move
+    movers = [(game, 1 - game.get_current_player()) for (game,) in games]
+
+    def move(game, move):
+        game.undo(game.apply(move))
+
+    return {
+        'move': _rate(move, moves, min_time),
+        'check_winner': _rate(Game.check_winner, movers, min_time),
+        'get_possible_moves': _rate(get_possible_moves, boards, min_time),
+        'evaluate_board': _rate(evaluate_board, boards, min_time),
+    }
+
+
+def bench_minimax(positions: list[tuple[int, int, int]], depths: list[int]) -> dict:
+    '''Nodes per second of main.minimax without a transposition table, maximizing for the player to move'''
+    results = {}
+    for depth in depths:
+        games = [Game.from_position(*position) for position in positions]
+        # minimax counts its nodes, the boards of its frontiers included, in the stats it is given
+        records = [Stats().begin(game) for game in games]
+        start = time.perf_counter()
+        for game, record in zip(games, records):
+            to_move = game.get_current_player()
+            main.minimax(game, depth, True, to_move, 1 - to_move, stats=record)
+        elapsed = time.perf_counter() - start
+        nodes = sum(record.counters['nodes'] for record in records)
+        results[str(depth)] = {'nodes': nodes, 'seconds': elapsed, 'nodes_per_second': nodes / elapsed}
+    return results
+
+
+def bench_alphabeta(positions: list[tuple[int, int, int]], depths: list[int]) -> dict:
+    # the move and evaluation tables of the modules fill on demand; fill them first, as in a running player
+    for position in positions:
+        AlphaBetaSearch(max_depth=max(depths), strict_depth=True, tt_bits=16).search(*position)
+    results = {}
+    for depth in depths:
+        nodes = 0
+        # each search allocates its table here, out of the timing, and the collector has seen them
+        searches = [AlphaBetaSearch(max_depth=depth, strict_depth=True) for _ in positions]
+        gc.collect()
+        start = time.perf_counter()
+        for search, position in zip(searches, positions):
+            search.search(*position)
+            nodes += search.nodes
+        elapsed = time.perf_counter() - start
+        results[str(depth)] = {'nodes': nodes, 'seconds': elapsed, 'nodes_per_second': nodes / elapsed}
+    return results
+
+
+def bench_mcts(positions: list[tuple[int, int, int]], simulations: int, seed: int) -> dict:
+    random.seed(seed)
+    player = make_player('mcts', {'num_simulations': simulations, 'reuse_tree': False})
+    start = time.perf_counter()
+    for position in positions:
+        player.make_move(Game.from_position(*position))
+    player_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for position in positions:
+        for _ in range(simulations):
+            playout(*position)
+    kernel_seconds = time.perf_counter() - start
+    count = len(positions) * simulations
+    return {
+        'simulations': simulations,
+        'playouts_per_second': count / player_seconds,
+        'kernel_playouts_per_second': count / kernel_seconds,
+    }
+
+
+def bench_memory(position: tuple[int, int, int], depth: int, simulations: int) -> dict:
+    '''Peak bytes of one search from position'''
+    to_move = position[2]
+    return {
+        'minimax': _peak_memory(main.minimax, Game.from_position(*position), depth, True, to_move, 1 - to_move),
+        'alphabeta': _peak_memory(AlphaBetaSearch(max_depth=depth, strict_depth=True).search, *position),
+        'mcts': _peak_memory(
+            make_player('mcts', {'num_simulations': simulations, 'reuse_tree': False}).make_move, Game.from_position(*position)
+        ),
+    }
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(positions: int = 100, seed: int = 0, min_time: float = 1.0, depths: tuple[int, ...] = (1, 2, 3),
+        search_positions: int = 5, simulations: int = 200) -> dict:
+    '''
+    Runs every benchmark and returns the results. The operations use all the positions,
+    the searches the first search_positions of them.
+    '''
+    positions = corpus(positions, seed)
+    searched = positions[:search_positions]
+    np.random.seed(seed)
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'corpus': {'positions': len(positions), 'seed': seed},
+        'operations': bench_operations(positions, min_time),
+        'minimax': bench_minimax(searched, list(depths)),
+        'alphabeta': bench_alphabeta(searched, list(depths)),
+        'mcts': bench_mcts(searched, simulations, seed),
+        'memory': bench_memory(searched[-1], max(depths), simulations),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the Quixo engine, printed as JSON')
+    parser.add_argument('--positions', type=int, default=100, help='positions of the corpus')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the corpus')
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds spent on each operation')
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 2, 3], help='search depths')
+    parser.add_argument('--search-positions', type=int, default=5, help='positions searched by the players')
+    parser.add_argument('--simulations', type=int, default=200, help='simulations per MCTS move')
+    parser.add_argument('--out', help='file the JSON is written to instead of stdout')
+    args = parser.parse_args()
+    results = run(args.positions, args.seed, args.min_time, tuple(args.depths), args.search_positions, args.simulations)
+    if args.out is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,210 @@
+'''
+Bitboard representation of the Quixo board.
+
+Each player's cubes are packed in a 25-bit integer: bit ``y * 5 + x`` is set when
+the player owns the cube at (X, Y), using the same (X, Y) convention as the game.
+Neutral cubes are the ones set in neither integer.
+
+Every one of the 44 legal (position, direction) pairs has a precomputed entry in
+``_APPLY``, so applying a move is a handful of integer operations. apply_packed does the
+same on both boards at once, for positions packed into one integer.
+'''
+import numpy as np
+
+SIZE = 5
+CELLS = SIZE * SIZE
+FULL = (1 << CELLS) - 1
+
+# same values as game.Move, kept here so this module does not depend on game
+TOP = 0
+BOTTOM = 1
+LEFT = 2
+RIGHT = 3
+
+
+def bit(x: int, y: int) -> int:
+    '''Returns the bit of the cube at (X, Y)'''
+    return 1 << (y * SIZE + x)
+
+
+# perimeter cubes, the only ones that can be taken
+PERIMETER = 0
+for _y in range(SIZE):
+    for _x in range(SIZE):
+        if _x in (0, SIZE - 1) or _y in (0, SIZE - 1):
+            PERIMETER |= bit(_x, _y)
+
+# the 12 winning lines: 5 rows, 5 columns and the 2 diagonals
+ROWS = tuple(sum(bit(x, y) for x in range(SIZE)) for y in range(SIZE))
+COLUMNS = tuple(sum(bit(x, y) for y in range(SIZE)) for x in range(SIZE))
+DIAGONALS = (
+    sum(bit(i, i) for i in range(SIZE)),
+    sum(bit(SIZE - 1 - i, i) for i in range(SIZE)),
+)
+LINES = ROWS + COLUMNS + DIAGONALS
+
+
+def _legal_directions(x: int, y: int) -> tuple[int, ...]:
+    '''A taken cube can be pushed back in from any side but the one it was taken from'''
+    directions = []
+    if y != 0:
+        directions.append(TOP)
+    if y != SIZE - 1:
+        directions.append(BOTTOM)
+    if x != 0:
+        directions.append(LEFT)
+    if x != SIZE - 1:
+        directions.append(RIGHT)
+    return tuple(directions)
+
+
+def _apply_entry(x: int, y: int, direction: int) -> tuple[int, int, int, int, int]:
+    '''
+    Builds the (keep, segment, shift left, shift right, destination) masks of a move.
+    The segment holds the cubes between the taken one and the destination side, which
+    all move by one cell towards the taken cube; every other cube stays in place.
+    '''
+    if direction == LEFT:
+        segment = sum(bit(i, y) for i in range(0, x))
+        shl, shr, destination = 1, 0, bit(0, y)
+    elif direction == RIGHT:
+        segment = sum(bit(i, y) for i in range(x + 1, SIZE))
+        shl, shr, destination = 0, 1, bit(SIZE - 1, y)
+    elif direction == TOP:
+        segment = sum(bit(x, i) for i in range(0, y))
+        shl, shr, destination = SIZE, 0, bit(x, 0)
+    else:
+        segment = sum(bit(x, i) for i in range(y + 1, SIZE))
+        shl, shr, destination = 0, SIZE, bit(x, SIZE - 1)
+    keep = FULL & ~(segment | bit(x, y))
+    return keep, segment, shl, shr, destination
+
+
+# the 44 legal moves as (x, y, direction), ordered by row then column
+MOVES = tuple(
+    (x, y, direction)
+    for y in range(SIZE)
+    for x in range(SIZE)
+    if bit(x, y) & PERIMETER
+    for direction in _legal_directions(x, y)
+)
+MOVE_INDEX = {move: move_id for move_id, move in enumerate(MOVES)}
+# bit of the cube taken by each move
+SOURCE = tuple(bit(x, y) for x, y, _ in MOVES)
+_APPLY = tuple(_apply_entry(*move) for move in MOVES)
+
+
+def is_legal(opponent: int, move_id: int) -> bool:
+    '''A move is legal when the taken cube is neutral or already belongs to the mover'''
+    return not opponent & SOURCE[move_id]
+
+
+def apply_move(mover: int, opponent: int, move_id: int) -> tuple[int, int]:
+    '''
+    Applies a move and returns the new (mover, opponent) bitboards.
+    Legality is not checked, see is_legal.
+    '''
+    keep, segment, shl, shr, destination = _APPLY[move_id]
+    return (
+        (mover & keep) | (((mover & segment) << shl) >> shr) | destination,
+        (opponent & keep) | (((opponent & segment) << shl) >> shr),
+    )
+
+
+def pack(board0: int, board1: int, to_move: int) -> int:
+    '''
+    Packs a position into one int, board0 | board1 << 25 | to_move << 50: the format of
+    Game.apply tokens, tree nodes, book keys and move records.
+    '''
+    return board0 | board1 << CELLS | to_move << 2 * CELLS
+
+
+def unpack(position: int) -> tuple[int, int, int]:
+    '''Returns the (board0, board1, to_move) of a packed position'''
+    return position & FULL, position >> CELLS & FULL, position >> 2 * CELLS
+
+
+# moves on packed positions, see pack:
+# _PACKED_APPLY[to_move][move_id] is (keep, segment, shl, shr, add), the masks of _APPLY
+# repeated for both boards, add setting the mover's destination bit and passing the turn
+_PACKED_APPLY = tuple(
+    tuple(
+        (
+            keep | keep << CELLS,
+            segment | segment << CELLS,
+            shl,
+            shr,
+            destination << CELLS * to_move | (1 - to_move) << 2 * CELLS,
+        )
+        for keep, segment, shl, shr, destination in _APPLY
+    )
+    for to_move in (0, 1)
+)
+
+
+def apply_packed(position: int, move_id: int) -> int:
+    '''
+    Applies a move for the player to move of a packed position and returns the packed result,
+    the other player to move. One table read moves both boards at once; legality is not checked.
+    '''
+    keep, segment, shl, shr, add = _PACKED_APPLY[position >> 2 * CELLS][move_id]
+    return (position & keep) | (((position & segment) << shl) >> shr) | add
+
+
+# bit 0 of every row and bit 0 of every column, used to test all rows or all columns at once
+_ROW_STARTS = sum(bit(0, y) for y in range(SIZE))
+_COLUMN_STARTS = ROWS[0]
+
+
+def has_line(player: int) -> bool:
+    '''Whether the player has completed a row, column or diagonal'''
+    return bool(
+        # a row is complete when its first cube survives the AND with the 4 cubes on its right
+        player & (player >> 1) & (player >> 2) & (player >> 3) & (player >> 4) & _ROW_STARTS
+        # a column is complete when its top cube survives the AND with the 4 cubes below it
+        or player & (player >> 5) & (player >> 10) & (player >> 15) & (player >> 20) & _COLUMN_STARTS
+        or player & DIAGONALS[0] == DIAGONALS[0]
+        or player & DIAGONALS[1] == DIAGONALS[1]
+    )
+
+
+def has_lines(players: np.ndarray) -> np.ndarray:
+    '''Vectorized has_line over an int64 array of bitboards'''
+    players = np.asarray(players, dtype=np.int64)
+    rows = players & (players >> 1) & (players >> 2) & (players >> 3) & (players >> 4) & _ROW_STARTS
+    columns = players & (players >> 5) & (players >> 10) & (players >> 15) & (players >> 20) & _COLUMN_STARTS
+    return (
+        (rows != 0)
+        | (columns != 0)
+        | ((players & DIAGONALS[0]) == DIAGONALS[0])
+        | ((players & DIAGONALS[1]) == DIAGONALS[1])
+    )
+
+
+def winner(board0: int, board1: int, mover: int) -> int:
+    '''
+    Returns the winner after a move of mover, otherwise -1.
+    A move completing a line for the opponent loses, even if it completes one for the mover too.
+    '''
+    if has_line((board0, board1)[1 - mover]):
+        return 1 - mover
+    if has_line((board0, board1)[mover]):
+        return mover
+    return -1
+
+
+_POWERS = 1 << np.arange(CELLS, dtype=np.int64)
+
+
+def from_array(board: np.ndarray) -> tuple[int, int]:
+    '''Packs a 5x5 board (-1 neutral, 0 and 1 players) into the two bitboards'''
+    flat = np.asarray(board).reshape(CELLS)
+    return int(_POWERS[flat == 0].sum()), int(_POWERS[flat == 1].sum())
+
+
+def to_array(board0: int, board1: int) -> np.ndarray:
+    '''Unpacks the two bitboards into a 5x5 board (-1 neutral, 0 and 1 players)'''
+    flat = np.full(CELLS, -1, dtype=np.int8)
+    flat[(board0 & _POWERS) != 0] = 0
+    flat[(board1 & _POWERS) != 0] = 1
+    return flat.reshape(SIZE, SIZE)
@@ -0,0 +1,141 @@
+'''
+Opening book: the best moves of the first plies, searched offline.
+
+Every game starts from the empty board, so the first positions a player meets are
+few and known in advance. The book holds, for each of them, the move and value of a
+deep alpha-beta search, keyed by the canonical form of the position under the 8
+board symmetries (see symmetry.py) so that one entry serves all its images.
+
+Build the book with `python book.py [path] [plies] [depth]`, then load it with
+OpeningBook; lookup answers with a dictionary access instead of a search.
+`python book.py --check [path]` searches a sample of its entries again.
+'''
+import json
+import sys
+
+import bitboard
+import symmetry
+from movegen import legal_move_ids
+from search import AlphaBetaSearch
+
+DEFAULT_PATH = 'book.json'
+# the first player of Game.play
+FIRST_PLAYER = 0
+
+
+def _key(board0: int, board1: int, to_move: int) -> tuple[int, int]:
+    '''Returns (key, symmetry): the packed canonical position and the symmetry mapping the position onto it'''
+    board0, board1, position_symmetry = symmetry.canonical(board0, board1)
+    return bitboard.pack(board0, board1, to_move), position_symmetry
+
+
+def _child(board0: int, board1: int, to_move: int, move_id: int) -> tuple[int, int, int]:
+    bitboards = (board0, board1)
+    mover, opponent = bitboard.apply_move(bitboards[to_move], bitboards[1 - to_move], move_id)
+    return (mover, opponent, 1) if to_move == 0 else (opponent, mover, 0)
+
+
+def build(path: str = DEFAULT_PATH, plies: int = 4, depth: int = 5, verbose: bool = True) -> None:
+    '''
+    Searches every position a player can meet in the first plies of a game while it follows
+    the book: all the replies of the opponent, but only the book moves of its own.
+    '''
+    positions = {}
+    for side in (0, 1):
+        # a separate search per side, as search values are scored for one side; strict_depth keeps
+        # the entries of earlier positions from changing a result, so every entry is the search
+        # of its position to depth
+        search = AlphaBetaSearch(max_depth=depth, strict_depth=True)
+        frontier = {_key(0, 0, FIRST_PLAYER)[0]: (0, 0, FIRST_PLAYER)}
+        for _ in range(plies):
+            next_frontier = {}
+            for board0, board1, to_move in frontier.values():
+                if to_move == side:
+                    key, position_symmetry = _key(board0, board1, to_move)
+                    if key not in positions:
+                        move_id, value, _ = search.search(board0, board1, to_move)
+                        if move_id is None:
+                            continue
+                        positions[key] = (symmetry.transform_move(position_symmetry, move_id), value)
+                    move_ids = (symmetry.transform_move(symmetry.INVERSE[position_symmetry], positions[key][0]),)
+                else:
+                    move_ids = legal_move_ids((board0, board1)[1 - to_move])
+                for move_id in move_ids:
+                    child = _child(board0, board1, to_move, move_id)
+                    if bitboard.winner(child[0], child[1], to_move) == -1:
+                        next_frontier.setdefault(_key(*child)[0], child)
+            frontier = next_frontier
+        if verbose:
+            print(f'player {side}: {len(positions)} positions', file=sys.stderr)
+
+    with open(path, 'w') as file:
+        json.dump({
+            'plies': plies,
+            'depth': depth,
+            'positions': {str(key): [move_id, value] for key, (move_id, value) in positions.items()},
+        }, file)
+
+
+class OpeningBook(object):
+    '''Book written by build; moves and values are given for the player to move'''
+
+    def __init__(self, path: str = DEFAULT_PATH) -> None:
+        with open(path) as file:
+            book = json.load(file)
+        self.plies = book['plies']
+        self.depth = book['depth']
+        self._positions = {int(key): tuple(entry) for key, entry in book['positions'].items()}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def probe(self, board0: int, board1: int, to_move: int) -> tuple[int, float] | None:
+        '''Returns the (move_id, value) of the book for the position, None if it is not in the book'''
+        key, position_symmetry = _key(board0, board1, to_move)
+        entry = self._positions.get(key)
+        if entry is None:
+            return None
+        move_id, value = entry
+        # stored moves are in the canonical frame
+        return symmetry.transform_move(symmetry.INVERSE[position_symmetry], move_id), value
+
+    def lookup(self, board0: int, board1: int, to_move: int) -> int | None:
+        '''Returns the id of the book move for the position, None if it is not in the book'''
+        entry = self.probe(board0, board1, to_move)
+        return entry[0] if entry is not None else None
+
+
+def _check(path: str = DEFAULT_PATH, positions: int = 50, seed: int = 0) -> None:
+    '''
+    Searches positions sampled from the book again, with a new AlphaBetaSearch to the depth of
+    the book, in a random image under the symmetries: the move given by probe must be legal,
+    and both the position and that move must have the value of the book
+    '''
+    import random
+
+    rng = random.Random(seed)
+    book = OpeningBook(path)
+    keys = sorted(book._positions)
+    for key in rng.sample(keys, min(positions, len(keys))):
+        board0, board1, to_move = bitboard.unpack(key)
+        image = rng.randrange(symmetry.COUNT)
+        board0, board1 = symmetry.transform(image, board0), symmetry.transform(image, board1)
+        move_id, value = book.probe(board0, board1, to_move)
+        assert move_id in legal_move_ids((board0, board1)[1 - to_move]), (board0, board1, to_move, move_id)
+        search = AlphaBetaSearch(max_depth=book.depth)
+        assert search.search(board0, board1, to_move)[1] == value, (board0, board1, to_move, value)
+        assert search.search_move(board0, board1, to_move, move_id, book.depth) == value, (
+            board0, board1, to_move, move_id, value
+        )
+    print(f'{min(positions, len(keys))} positions checked')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--check']:
+        _check(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH)
+    else:
+        build(
+            sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 4,
+            int(sys.argv[3]) if len(sys.argv) > 3 else 5,
+        )
@@ -0,0 +1,214 @@
+'''
+Retrograde solver for the positions without neutral cubes, and its on-disk table.
+
+Once every cube is taken, the board of the player to move determines the position:
+the other player owns the rest. The table has one entry per such board, so the board
+is a perfect hash of the 2^25 positions of the subset, whichever player is to move.
+The subset is closed, as no move brings a neutral cube back, so it is solved on its own.
+
+An entry packs the result for the player to move in its top 2 bits and the distance
+to the end, in plies, in the other 14. The build works backwards from the positions
+won or lost in one move. A position is won in d plies as soon as one move leads to a
+position lost in d - 1, and lost in d when its last undecided move leads to a
+position won in d - 1. On a full board a move only permutes the cubes, so each
+position and move have at most one predecessor, found by sliding the segment back.
+
+Build the table with `python endgame.py [path]` (a few minutes, 64 MB), then probe it
+through EndgameTable, which maps the file in memory. Only the alpha-beta search of
+search.py probes it, at its nodes and frontier children without neutral cubes.
+`python endgame.py --check [path]` compares a sample of a built table with searches that
+do not probe it.
+'''
+import sys
+
+import numpy as np
+
+import bitboard
+
+# results, for the player to move
+DRAW = 0
+WIN = 1
+LOSS = 2
+# the position already has a line, so it is not a position to move from
+FINISHED = 3
+
+_DISTANCE_BITS = 14
+_DISTANCE_MASK = (1 << _DISTANCE_BITS) - 1
+SIZE = 1 << bitboard.CELLS
+DEFAULT_PATH = 'endgame.npy'
+# states per vectorized step of the build
+_CHUNK = 1 << 20
+
+_FULL = bitboard.FULL
+
+
+def index(board0: int, board1: int, to_move: int) -> int | None:
+    '''Returns the entry of a position, None if it has neutral cubes'''
+    if board0 | board1 != _FULL:
+        return None
+    return (board0, board1)[to_move]
+
+
+def _entry(result: int, distance: int) -> int:
+    return result << _DISTANCE_BITS | distance
+
+
+def _moves():
+    '''Yields (source, keep, segment, shl, shr, destination, shifted segment) of every move'''
+    for source, (keep, segment, shl, shr, destination) in zip(bitboard.SOURCE, bitboard._APPLY):
+        yield source, keep, segment, shl, shr, destination, ((segment << shl) >> shr)
+
+
+def _initial(lines: np.ndarray, start: int, stop: int) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Returns the entries of the states start..stop that are decided in one move, and their number
+    of moves leading to an undecided position
+    '''
+    states = np.arange(start, stop, dtype=np.int64)
+    others = _FULL ^ states
+    wins = np.zeros(len(states), dtype=bool)
+    losing_moves = np.zeros(len(states), dtype=bool)
+    open_moves = np.zeros(len(states), dtype=np.uint8)
+    for source, keep, segment, shl, shr, destination, _ in _moves():
+        legal = (states & source) != 0
+        # the taken cube is the mover's, so the other player's cubes only slide
+        after = (others & keep) | (((others & segment) << shl) >> shr)
+        other_line = lines[after]
+        own_line = lines[_FULL ^ after]
+        wins |= legal & own_line & ~other_line
+        losing_moves |= legal & other_line
+        open_moves += legal & ~other_line & ~own_line
+    entries = np.zeros(len(states), dtype=np.uint16)
+    entries[losing_moves & (open_moves == 0)] = _entry(LOSS, 1)
+    entries[wins] = _entry(WIN, 1)
+    entries[lines[states] | lines[others]] = _entry(FINISHED, 0)
+    return entries, open_moves
+
+
+def _predecessors(states: np.ndarray) -> np.ndarray:
+    '''Returns the states that reach one of states in one move, with repetitions'''
+    found = []
+    for _, keep, _, shl, shr, destination, shifted in _moves():
+        # the cube pushed in at the destination is the mover's, so not one of the next player's
+        after = states[(states & destination) == 0]
+        # the next player is the other player of the move, whose cubes slide back
+        others = (after & keep) | (((after & shifted) << shr) >> shl)
+        found.append(_FULL ^ others)
+    return np.concatenate(found)
+
+
+def build(path: str = DEFAULT_PATH, verbose: bool = True) -> None:
+    '''Solves the positions without neutral cubes and writes the table to path'''
+    lines = np.zeros(SIZE, dtype=bool)
+    for start in range(0, SIZE, _CHUNK):
+        lines[start:start + _CHUNK] = bitboard.has_lines(np.arange(start, start + _CHUNK, dtype=np.int64))
+
+    entries = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint16, shape=(SIZE,))
+    open_moves = np.zeros(SIZE, dtype=np.uint8)
+    for start in range(0, SIZE, _CHUNK):
+        entries[start:start + _CHUNK], open_moves[start:start + _CHUNK] = _initial(lines, start, start + _CHUNK)
+    table = np.array(entries)
+
+    distance = 1
+    decided = np.flatnonzero((table == _entry(WIN, 1)) | (table == _entry(LOSS, 1)))
+    while len(decided):
+        if verbose:
+            print(f'distance {distance}: {len(decided)} positions', file=sys.stderr)
+        results = table[decided] >> _DISTANCE_BITS
+        next_decided = []
+        # a move to a lost position wins
+        for start in range(0, len(decided), _CHUNK):
+            chunk = decided[start:start + _CHUNK]
+            winners = _predecessors(chunk[results[start:start + _CHUNK] == LOSS])
+            winners = np.unique(winners[table[winners] == _entry(DRAW, 0)])
+            table[winners] = _entry(WIN, distance + 1)
+            next_decided.append(winners)
+        # a position is lost when its last open move leads to a won position
+        for start in range(0, len(decided), _CHUNK):
+            chunk = decided[start:start + _CHUNK]
+            losers = _predecessors(chunk[results[start:start + _CHUNK] == WIN])
+            losers = losers[table[losers] == _entry(DRAW, 0)]
+            np.subtract.at(open_moves, losers, 1)
+            losers = np.unique(losers[open_moves[losers] == 0])
+            table[losers] = _entry(LOSS, distance + 1)
+            next_decided.append(losers)
+        decided = np.concatenate(next_decided)
+        distance += 1
+
+    entries[:] = table
+    entries.flush()
+    if verbose:
+        results = table >> _DISTANCE_BITS
+        print(
+            f'won {np.count_nonzero(results == WIN)}, lost {np.count_nonzero(results == LOSS)}, '
+            f'drawn {np.count_nonzero(table == _entry(DRAW, 0))}, finished {np.count_nonzero(results == FINISHED)}',
+            file=sys.stderr,
+        )
+
+
+class EndgameTable(object):
+    '''Read-only view of a table written by build, mapped in memory'''
+
+    def __init__(self, path: str = DEFAULT_PATH) -> None:
+        self.path = path
+        self._entries = np.load(path, mmap_mode='r')
+        self.probes = 0
+        self.hits = 0
+
+    def __reduce__(self):
+        # other processes map the file again rather than receiving a copy
+        return EndgameTable, (self.path,)
+
+    def probe(self, board0: int, board1: int, to_move: int) -> tuple[int, int] | None:
+        '''
+        Returns (result, distance) for the player to move: WIN, LOSS or DRAW, and the plies
+        to the winning move. None if the position has neutral cubes or already has a line.
+        '''
+        self.probes += 1
+        entry_index = index(board0, board1, to_move)
+        if entry_index is None:
+            return None
+        entry = int(self._entries[entry_index])
+        result = entry >> _DISTANCE_BITS
+        if result == FINISHED:
+            return None
+        self.hits += 1
+        return result, entry & _DISTANCE_MASK
+
+
+def _check(path: str = DEFAULT_PATH, positions: int = 20, depth: int = 5, seed: int = 0) -> None:
+    '''
+    Searches positions sampled from the table with AlphaBetaSearch, without the table, to depth
+    plies: positions won or lost at each distance up to depth + 2, and drawn ones. A win or loss
+    within depth must be found at its distance, a draw or a longer result must not be found decided.
+    '''
+    import random
+
+    from search import WIN as WIN_SCORE, AlphaBetaSearch
+
+    rng = random.Random(seed)
+    entries = np.load(path, mmap_mode='r')
+    classes = [_entry(result, distance) for result in (WIN, LOSS) for distance in range(1, depth + 3)]
+    checked = 0
+    for entry in classes + [_entry(DRAW, 0)]:
+        states = np.flatnonzero(entries == entry)
+        result, distance = entry >> _DISTANCE_BITS, entry & _DISTANCE_MASK
+        for _ in range(min(positions, len(states))):
+            state = int(states[rng.randrange(len(states))])
+            to_move = rng.randrange(2)
+            board0, board1 = (state, _FULL ^ state) if to_move == 0 else (_FULL ^ state, state)
+            _, value, _ = AlphaBetaSearch(max_depth=depth).search(board0, board1, to_move)
+            if result == DRAW or distance > depth:
+                assert abs(value) < WIN_SCORE - depth, (board0, board1, to_move, result, distance, value)
+            else:
+                expected = WIN_SCORE - distance if result == WIN else distance - WIN_SCORE
+                assert value == expected, (board0, board1, to_move, result, distance, value)
+            checked += 1
+    print(f'{checked} positions checked')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--check']:
+        _check(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH)
+    else:
+        build(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH)
@@ -0,0 +1,149 @@
+'''
+Line-score heuristic used by the search players.
+
+Every row, column and diagonal scores (own cubes - opponent cubes) ** 2, and the
+board scores the sum over the 12 lines.
+
+IncrementalEvaluator keeps the per-line counts of the position a search is at, so a
+search scores a position and its children without counting cubes again.
+A move only changes the cubes of its own row or column, so the change of every line's
+counts follows from the move and the content of that one line: it is looked up in a
+table filled on demand, and the score of a child, with its winner, costs a few
+operations per line that changes.
+'''
+import numpy as np
+
+import bitboard
+
+
+def evaluate_bitboards(player: int, opponent: int) -> int:
+    '''Scores the position for the owner of the player bitboard'''
+    score = 0
+    for line in bitboard.LINES:
+        line_score = (player & line).bit_count() - (opponent & line).bit_count()
+        score += line_score * line_score
+    return score
+
+
+def evaluate_board(board: np.ndarray, player_marker: int) -> int:
+    '''Scores a 5x5 board (-1 neutral, 0 and 1 players) for player_marker'''
+    bitboards = bitboard.from_array(board)
+    return evaluate_bitboards(bitboards[player_marker], bitboards[1 - player_marker])
+
+
+# line of each move, in bitboard.LINES: the row of a LEFT or RIGHT slide, the column of a TOP or BOTTOM one
+_MOVE_LINES = tuple(
+    y if direction in (bitboard.LEFT, bitboard.RIGHT) else bitboard.SIZE + x for x, y, direction in bitboard.MOVES
+)
+# cells of the column starting at bit 0 -> the same cubes packed as a row
+_COLUMN_BITS = {
+    sum(1 << (bitboard.SIZE * i) for i in range(bitboard.SIZE) if bits >> i & 1): bits
+    for bits in range(1 << bitboard.SIZE)
+}
+_COLUMN = bitboard.COLUMNS[0]
+# (mover, move id, line pattern) -> ((line, change of its count difference), ...), filled on demand
+_DELTAS: dict[int, tuple[tuple[int, int], ...]] = {}
+
+
+def line_differences(board0: int, board1: int) -> list[int]:
+    '''Player 0 cubes minus player 1 cubes on each line of bitboard.LINES'''
+    return [(board0 & line).bit_count() - (board1 & line).bit_count() for line in bitboard.LINES]
+
+
+def _line_pattern(board0: int, board1: int, line: int) -> int:
+    '''The cubes of a row or column, player 0 in the low 5 bits and player 1 in the next 5'''
+    if line < bitboard.SIZE:
+        shift = bitboard.SIZE * line
+        return (board0 >> shift & 31) | (board1 >> shift & 31) << bitboard.SIZE
+    shift = line - bitboard.SIZE
+    return _COLUMN_BITS[board0 >> shift & _COLUMN] | _COLUMN_BITS[board1 >> shift & _COLUMN] << bitboard.SIZE
+
+
+def _line_deltas(mover: int, move_id: int, pattern: int) -> tuple[tuple[int, int], ...]:
+    '''The lines whose count difference move_id changes, when its row or column holds pattern'''
+    key = (mover * len(bitboard.MOVES) + move_id) << 2 * bitboard.SIZE | pattern
+    deltas = _DELTAS.get(key)
+    if deltas is None:
+        # the other cells do not move, so a board holding only that line gives the changes
+        cells = [cell for cell in range(bitboard.CELLS) if bitboard.LINES[_MOVE_LINES[move_id]] >> cell & 1]
+        before = [0, 0]
+        for player in (0, 1):
+            for index, cell in enumerate(cells):
+                if pattern >> (bitboard.SIZE * player + index) & 1:
+                    before[player] |= 1 << cell
+        after = list(before)
+        after[mover], after[1 - mover] = bitboard.apply_move(before[mover], before[1 - mover], move_id)
+        deltas = _DELTAS[key] = tuple(
+            (line, difference - previous)
+            for line, (previous, difference) in enumerate(zip(line_differences(*before), line_differences(*after)))
+            if difference != previous
+        )
+    return deltas
+
+
+class IncrementalEvaluator(object):
+    '''
+    Per-line counts of a position, kept in step with a search by apply and undo.
+    diffs holds line_differences and score their sum of squares, which is
+    evaluate_bitboards of the position for either player.
+    '''
+
+    def __init__(self, board0: int, board1: int) -> None:
+        self.reset(board0, board1)
+
+    def reset(self, board0: int, board1: int) -> None:
+        self.diffs = line_differences(board0, board1)
+        self.score = sum(difference * difference for difference in self.diffs)
+        self._undo = []
+
+    def apply(self, board0: int, board1: int, to_move: int, move_id: int) -> None:
+        '''Follows move_id of to_move from the position (board0, board1), which must be the current one'''
+        deltas = _line_deltas(to_move, move_id, _line_pattern(board0, board1, _MOVE_LINES[move_id]))
+        self._undo.append((deltas, self.score))
+        diffs = self.diffs
+        score = self.score
+        for line, delta in deltas:
+            difference = diffs[line]
+            score += delta * (2 * difference + delta)
+            diffs[line] = difference + delta
+        self.score = score
+
+    def undo(self) -> None:
+        '''Takes back the last apply'''
+        deltas, self.score = self._undo.pop()
+        diffs = self.diffs
+        for line, delta in deltas:
+            diffs[line] -= delta
+
+    def children(self, board0: int, board1: int, to_move: int, move_ids) -> list[tuple[int, int]]:
+        '''
+        Returns the (score, winner) after each of move_ids from the current position, without applying them.
+        winner follows bitboard.winner, assuming the current position has no line.
+        '''
+        diffs = self.diffs
+        base = self.score
+        # a line is complete for player 0 at a difference of 5, for player 1 at -5
+        mover_full = bitboard.SIZE if to_move == 0 else -bitboard.SIZE
+        # the moves of a row or column share its pattern
+        patterns = [None] * (2 * bitboard.SIZE)
+        move_key = to_move * len(bitboard.MOVES)
+        results = []
+        for move_id in move_ids:
+            line = _MOVE_LINES[move_id]
+            pattern = patterns[line]
+            if pattern is None:
+                pattern = patterns[line] = _line_pattern(board0, board1, line)
+            deltas = _DELTAS.get((move_key + move_id) << 2 * bitboard.SIZE | pattern)
+            if deltas is None:
+                deltas = _line_deltas(to_move, move_id, pattern)
+            score = base
+            winner = -1
+            for line, delta in deltas:
+                difference = diffs[line] + delta
+                score += delta * (2 * diffs[line] + delta)
+                if difference == -mover_full:
+                    winner = 1 - to_move
+                elif difference == mover_full and winner == -1:
+                    winner = to_move
+            results.append((score, winner))
+        return results
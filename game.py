@@ -1,9 +1,14 @@
 from abc import ABC, abstractmethod
 
-from copy import deepcopy
 from enum import Enum
+import time
+
 import numpy as np
 
+import bitboard
+from stats import Stats
+from transposition import zobrist
+
 # Rules on PDF
 
 
@@ -18,10 +23,18 @@ class Move(Enum):
 
 
 class Player(ABC):
+    # per-move counters and timings, see stats.py; None when disabled
+    stats = None
+
     def __init__(self) -> None:
         '''You can change this for your player if you need to handle state/have memory'''
         pass
 
+    def enable_stats(self, hooks=()) -> Stats:
+        '''Starts recording the work of each move, hooks being called with every finished move'''
+        self.stats = Stats(hooks)
+        return self.stats
+
     @abstractmethod
     def make_move(self, game: 'Game') -> tuple[tuple[int, int], Move]:
         '''
@@ -36,21 +49,45 @@ class Player(ABC):
 
 class Game(object):
     def __init__(self) -> None:
-        self._board = np.ones((5, 5), dtype=np.uint8) * -1
+        # one bitboard per player, see bitboard.py
+        self._bitboards = [0, 0]
         self.current_player_idx = 1
 
+    @classmethod
+    def from_position(cls, board0: int, board1: int, to_move: int) -> 'Game':
+        '''Returns a game in the position of the bitboards board0 and board1, to_move being the current player'''
+        game = cls()
+        game._bitboards = [board0, board1]
+        game.current_player_idx = to_move
+        return game
+
+    @property
+    def _board(self) -> np.ndarray:
+        '''The board as a 5x5 array: -1 are neutral pieces, 0 and 1 are the players' pieces'''
+        return bitboard.to_array(*self._bitboards)
+
+    @_board.setter
+    def _board(self, board: np.ndarray) -> None:
+        self._bitboards = list(bitboard.from_array(board))
+
     def get_board(self) -> np.ndarray:
         '''
         Returns the board
         '''
-        return deepcopy(self._board)
+        return self._board
+
+    def get_bitboards(self) -> tuple[int, int]:
+        '''
+        Returns the bitboards of player 0 and player 1, see bitboard.py
+        '''
+        return self._bitboards[0], self._bitboards[1]
 
 
     def get_current_player(self) -> int:
         '''
         Returns the current player
         '''
-        return deepcopy(self.current_player_idx)
+        return self.current_player_idx
     
     """
     def print(self):
@@ -61,210 +98,141 @@ class Game(object):
         '''Prints the board in a more readable format.'''
         # Create a mapping from internal representation to display characters
         display_mapping = {-1: ' ', 0: 'O', 1: 'X'}
+        board = self._board
         
         # Construct and print the board row by row
-        for row in self._board:
+        for row in board:
             display_row = [display_mapping[cell] for cell in row]
             print('|' + '|'.join(display_row) + '|')
         
         # Optionally, print a separator for readability
-        print('-' * (2 * len(self._board[0]) + 1))
+        print('-' * (2 * len(board[0]) + 1))
     
 
-    def check_winner(self) -> int:
-        '''Check the winner. Returns the player ID of the winner if any, otherwise returns -1'''
-        # for each row
-        for x in range(self._board.shape[0]):
-            # if a player has completed an entire row
-            if self._board[x, 0] != -1 and all(self._board[x, :] == self._board[x, 0]):
-                # return the relative id
-                return self._board[x, 0]
-        # for each column
-        for y in range(self._board.shape[1]):
-            # if a player has completed an entire column
-            if self._board[0, y] != -1 and all(self._board[:, y] == self._board[0, y]):
-                # return the relative id
-                return self._board[0, y]
-        # if a player has completed the principal diagonal
-        if self._board[0, 0] != -1 and all(
-            [self._board[x, x]
-                for x in range(self._board.shape[0])] == self._board[0, 0]
-        ):
-            # return the relative id
-            return self._board[0, 0]
-        # if a player has completed the secondary diagonal
-        if self._board[0, -1] != -1 and all(
-            [self._board[x, -(x + 1)]
-             for x in range(self._board.shape[0])] == self._board[0, -1]
-        ):
-            # return the relative id
-            return self._board[0, -1]
-        return -1
+    def check_winner(self, mover: int) -> int:
+        '''
+        Check the winner. Returns the player ID of the winner if any, otherwise returns -1.
+        mover is the player who made the last move: the current player within play(), the
+        other one after apply(), which passes the turn.
+        If the last move completed lines for both players, the mover loses.
+        '''
+        return bitboard.winner(self._bitboards[0], self._bitboards[1], mover)
     
     
     def my_make_move(self, current_board, possible_move , current_player_idx):
+        '''
+        Returns the board obtained by playing possible_move on current_board, or None if the move is not valid.
+        Neither current_board nor the game are modified.
+        '''
         from_pos, slide = possible_move
-        original_board = deepcopy(self._board)
-
-        self._board = current_board
-
-        #print ('from this current move i do my_make_move',current_board)
+        bitboards = list(bitboard.from_array(current_board))
+        if not self.__apply(bitboards, from_pos, slide, current_player_idx):
+            return None
+        return bitboard.to_array(*bitboards)
 
-        result_board = None
-
-        ok = self.__move(from_pos, slide, current_player_idx)
-
-        if ok:
-            #print('my_make_move works')
-            result_board = deepcopy(self._board)
-            #print ('result_board is \n', result_board)
-        else:
-            #print('error in my_make_move\n')
-            pass
-
-        self._board = deepcopy(original_board)
-        return result_board
-    
-
-    def play(self, player1: Player, player2: Player) -> int:
-        '''Play the game. Returns the winning player'''
+    def apply(self, move: tuple[tuple[int, int], Move]) -> int | None:
+        '''
+        Plays move for the current player in place and passes the turn to the other player.
+        Returns a token for undo, or None if the move is not valid (the game is left untouched).
+        '''
+        token = bitboard.pack(self._bitboards[0], self._bitboards[1], self.current_player_idx)
+        from_pos, slide = move
+        if not self.__apply(self._bitboards, from_pos, slide, self.current_player_idx):
+            return None
+        self.current_player_idx = 1 - self.current_player_idx
+        return token
+
+    def undo(self, token: int) -> None:
+        '''
+        Restores the state the game was in before the apply call that returned token.
+        Tokens pack the whole state, so undoing the first of several moves restores it directly.
+        '''
+        self._bitboards[0], self._bitboards[1], self.current_player_idx = bitboard.unpack(token)
+
+
+    def play(
+        self,
+        player1: Player,
+        player2: Player,
+        verbose: bool = True,
+        max_plies: int | None = None,
+        repetitions: int | None = None,
+        move_time: float | None = None,
+        max_illegal: int | None = None,
+    ) -> int:
+        '''
+        Play the game. Returns the winning player, or -1 for a draw.
+        verbose: print the winner and the final board.
+        max_plies: the game is drawn after that many moves.
+        repetitions: the game is drawn when a position, with the player to move, occurs that many times.
+        move_time: seconds a player has for a move, illegal attempts included; a player over it loses.
+        max_illegal: illegal moves a player may return in a row; one more loses.
+        After the game, plies, illegal_moves (per player) and end ('line', 'max_plies', 'repetition',
+        'time' or 'illegal') describe how it went, and current_player_idx is the player who moved last.
+        '''
         players = [player1, player2]
         winner = -1
-        move_count = 0  # Keep track of moves
+        self.plies = 0
+        self.illegal_moves = [0, 0]
+        self.end = None
+        seen = {}
         while winner < 0:
-            self.current_player_idx += 1
-            self.current_player_idx %= len(players)
-            ok = False
-            while not ok:
-                #print(f"Player {self.current_player_idx}'s turn:")  # Indicate whose turn it is
+            next_player = (self.current_player_idx + 1) % len(players)
+            # a drawn game stops before the turn passes, as a won one does
+            if repetitions is not None:
+                key = zobrist(self._bitboards[0], self._bitboards[1], next_player)
+                seen[key] = seen.get(key, 0) + 1
+                if seen[key] >= repetitions:
+                    self.end = 'repetition'
+                    break
+            if max_plies is not None and self.plies >= max_plies:
+                self.end = 'max_plies'
+                break
+            self.current_player_idx = next_player
+            start = time.perf_counter()
+            retries = 0
+            while True:
                 from_pos, slide = players[self.current_player_idx].make_move(self)
-                #print(from_pos)
-                #print(slide)
-                ok = self.__move(from_pos, slide, self.current_player_idx)
-                if ok:
-                    move_count += 1
-                    #self.print()  # Print the board after each successful move
-                    #count_pause= input("enter a number:")
-                else:
-                    #print("Invalid move, trying again...")
-                    pass
-            winner = self.check_winner()
-        
-        if winner != -1:
-            print(f"Game Over. Winner: Player {winner}")
+                if move_time is not None and time.perf_counter() - start > move_time:
+                    self.end = 'time'
+                    break
+                if self.__move(from_pos, slide, self.current_player_idx):
+                    break
+                self.illegal_moves[self.current_player_idx] += 1
+                retries += 1
+                if max_illegal is not None and retries > max_illegal:
+                    self.end = 'illegal'
+                    break
+            if self.end is not None:
+                winner = 1 - self.current_player_idx
+                break
+            self.plies += 1
+            winner = self.check_winner(self.current_player_idx)
+        else:
+            self.end = 'line'
+
+        if verbose:
+            if winner != -1:
+                print(f"Game Over. Winner: Player {winner}")
+            else:
+                print(f"Game Over. Draw by {self.end.replace('_', ' ')}")
             self.print()
         return winner
-    
-    
-    
+
     def __move(self, from_pos: tuple[int, int], slide: Move, player_id: int) -> bool:
         '''Perform a move'''
-        if player_id > 2:
-            return False
-        # Oh God, Numpy arrays
-        prev_value = deepcopy(self._board[(from_pos[1], from_pos[0])])
-        
-        acceptable = self.__take((from_pos[1], from_pos[0]), player_id)
-        if acceptable:
-            acceptable = self.__slide((from_pos[1], from_pos[0]), slide)
-            if not acceptable:
-                self._board[(from_pos[1], from_pos[0])] = deepcopy(prev_value)
-        return acceptable
-
-    def __take(self, from_pos: tuple[int, int], player_id: int) -> bool:
-        '''Take piece'''
-        # acceptable only if in border
-        acceptable: bool = (
-            # check if it is in the first row
-            (from_pos[0] == 0 and from_pos[1] < 5)
-            # check if it is in the last row
-            or (from_pos[0] == 4 and from_pos[1] < 5)
-            # check if it is in the first column
-            or (from_pos[1] == 0 and from_pos[0] < 5)
-            # check if it is in the last column
-            or (from_pos[1] == 4 and from_pos[0] < 5)
-            # and check if the piece can be moved by the current player
-        ) and (self._board[from_pos] < 0 or self._board[from_pos] == player_id)
-        if acceptable:
-            self._board[from_pos] = player_id
-        return acceptable
+        return self.__apply(self._bitboards, from_pos, slide, player_id)
 
-    def __slide(self, from_pos: tuple[int, int], slide: Move) -> bool:
-        '''Slide the other pieces'''
-        # define the corners
-        SIDES = [(0, 0), (0, 4), (4, 0), (4, 4)]
-        # if the piece position is not in a corner
-        if from_pos not in SIDES:
-            # if it is at the TOP, it can be moved down, left or right
-            acceptable_top: bool = from_pos[0] == 0 and (
-                slide == Move.BOTTOM or slide == Move.LEFT or slide == Move.RIGHT
-            )
-            # if it is at the BOTTOM, it can be moved up, left or right
-            acceptable_bottom: bool = from_pos[0] == 4 and (
-                slide == Move.TOP or slide == Move.LEFT or slide == Move.RIGHT
-            )
-            # if it is on the LEFT, it can be moved up, down or right
-            acceptable_left: bool = from_pos[1] == 0 and (
-                slide == Move.BOTTOM or slide == Move.TOP or slide == Move.RIGHT
-            )
-            # if it is on the RIGHT, it can be moved up, down or left
-            acceptable_right: bool = from_pos[1] == 4 and (
-                slide == Move.BOTTOM or slide == Move.TOP or slide == Move.LEFT
-            )
-        # if the piece position is in a corner
-        else:
-            # if it is in the upper left corner, it can be moved to the right and down
-            acceptable_top: bool = from_pos == (0, 0) and (
-                slide == Move.BOTTOM or slide == Move.RIGHT)
-            # if it is in the lower left corner, it can be moved to the right and up
-            acceptable_left: bool = from_pos == (4, 0) and (
-                slide == Move.TOP or slide == Move.RIGHT)
-            # if it is in the upper right corner, it can be moved to the left and down
-            acceptable_right: bool = from_pos == (0, 4) and (
-                slide == Move.BOTTOM or slide == Move.LEFT)
-            # if it is in the lower right corner, it can be moved to the left and up
-            acceptable_bottom: bool = from_pos == (4, 4) and (
-                slide == Move.TOP or slide == Move.LEFT)
-        # check if the move is acceptable
-        acceptable: bool = acceptable_top or acceptable_bottom or acceptable_left or acceptable_right
-        # if it is
-        if acceptable:
-            # take the piece
-            piece = self._board[from_pos]
-            # if the player wants to slide it to the left
-            if slide == Move.LEFT:
-                # for each column starting from the column of the piece and moving to the left
-                for i in range(from_pos[1], 0, -1):
-                    # copy the value contained in the same row and the previous column
-                    self._board[(from_pos[0], i)] = self._board[(
-                        from_pos[0], i - 1)]
-                # move the piece to the left
-                self._board[(from_pos[0], 0)] = piece
-            # if the player wants to slide it to the right
-            elif slide == Move.RIGHT:
-                # for each column starting from the column of the piece and moving to the right
-                for i in range(from_pos[1], self._board.shape[1] - 1, 1):
-                    # copy the value contained in the same row and the following column
-                    self._board[(from_pos[0], i)] = self._board[(
-                        from_pos[0], i + 1)]
-                # move the piece to the right
-                self._board[(from_pos[0], self._board.shape[1] - 1)] = piece
-            # if the player wants to slide it upward
-            elif slide == Move.TOP:
-                # for each row starting from the row of the piece and going upward
-                for i in range(from_pos[0], 0, -1):
-                    # copy the value contained in the same column and the previous row
-                    self._board[(i, from_pos[1])] = self._board[(
-                        i - 1, from_pos[1])]
-                # move the piece up
-                self._board[(0, from_pos[1])] = piece
-            # if the player wants to slide it downward
-            elif slide == Move.BOTTOM:
-                # for each row starting from the row of the piece and going downward
-                for i in range(from_pos[0], self._board.shape[0] - 1, 1):
-                    # copy the value contained in the same column and the following row
-                    self._board[(i, from_pos[1])] = self._board[(
-                        i + 1, from_pos[1])]
-                # move the piece down
-                self._board[(self._board.shape[0] - 1, from_pos[1])] = piece
-        return acceptable
+    @staticmethod
+    def __apply(bitboards: list[int], from_pos: tuple[int, int], slide: Move, player_id: int) -> bool:
+        '''Take the piece at from_pos and slide it in, updating bitboards in place if the move is acceptable'''
+        if player_id not in (0, 1):
+            return False
+        move_id = bitboard.MOVE_INDEX.get((from_pos[0], from_pos[1], slide.value))
+        # acceptable only if in border and the piece can be moved by the current player
+        if move_id is None or not bitboard.is_legal(bitboards[1 - player_id], move_id):
+            return False
+        bitboards[player_id], bitboards[1 - player_id] = bitboard.apply_move(
+            bitboards[player_id], bitboards[1 - player_id], move_id
+        )
+        return True
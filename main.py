@@ -1,6 +1,9 @@
 import random
 from game import Game, Move, Player
-from copy import deepcopy
+from movegen import MOVES, MOVE_IDS, legal_move_ids, unique_moves
+from evaluation import IncrementalEvaluator
+from transposition import EXACT, TranspositionTable
+from book import OpeningBook
 
 class RandomPlayer(Player):
     def __init__(self) -> None:
@@ -15,26 +18,53 @@ class RandomPlayer(Player):
 
 ##modify
 class MyPlayer(Player):
-    def __init__(self) -> None:
+    def __init__(self, tt_bits=20, symmetric=False, book=None) -> None:
+        '''book: path of an opening book built by book.py, played before searching'''
         super().__init__()
+        self.book = OpeningBook(book) if book is not None else None
+        # search results are kept across moves; they are scored for one side, so the table is cleared if the side changes
+        self.tt = TranspositionTable(tt_bits, symmetric)
+        self.player_id = None
 
     def make_move(self, game: 'Game') -> tuple[tuple[int, int], Move]:
+        move_stats = self.stats.begin(game) if self.stats is not None else None
+        if self.book is not None:
+            move_id = self.book.lookup(*game.get_bitboards(), game.get_current_player())
+            if move_id is not None:
+                if move_stats is not None:
+                    move_stats.count('book_moves')
+                    self.stats.end(move_stats)
+                return MOVES[move_id]
         best_score = float('-inf')
         best_move = None
-        current_board = game.get_board()
         player_id = game.get_current_player()
+        if player_id != self.player_id:
+            # the table is empty before the first move
+            if self.player_id is not None:
+                self.tt.clear()
+            self.player_id = player_id
+        self.tt.new_search()
+        probes, hits = self.tt.probes, self.tt.hits
 
         #print('possible move for my player', get_possible_moves(current_board, player_id))
         #print('#possible moves:', get_possible_moves(current_board, player_id).__len__)
-        for possible_move in get_possible_moves(current_board, player_id):
+        # moves that a symmetry of the position maps onto an earlier one would score the same
+        for possible_move in unique_moves(*game.get_bitboards(), player_id):
             #print('\n posible move for my player', possible_move)
-            simulated_board = game.my_make_move(game.get_board(), possible_move, player_id)
-            if simulated_board is not None:  # Ensure the move is valid
-                score = minimax(simulated_board, 3, True, player_id, 1 - player_id)
+            # play the move on the game itself and take it back once it has been searched
+            token = game.apply(possible_move)
+            if token is not None:  # Ensure the move is valid
+                # the opponent replies next
+                score = minimax(game, 3, False, player_id, 1 - player_id, self.tt, stats=move_stats)
+                game.undo(token)
                 if score > best_score:
                     best_score = score
                     best_move = possible_move
 
+        if move_stats is not None:
+            move_stats.count('tt_probes', self.tt.probes - probes)
+            move_stats.count('tt_hits', self.tt.hits - hits)
+            self.stats.end(move_stats)
         from_pos , move = best_move
         #print('frompos my player', from_pos)
         #print('move', move)
@@ -45,165 +75,82 @@ class MyPlayer(Player):
 
 
 
-def minimax(board, depth, is_maximizing, player_marker, opponent_marker):
-    if depth == 0 or game_over(board):
-        return evaluate_board(board, player_marker)
+def minimax(game, depth, is_maximizing, player_marker, opponent_marker, tt=None, tt_key=None, stats=None, evaluator=None):
+    '''
+    Searches the game in place with apply/undo, the game is left as it was found.
+    With a transposition table tt, tt_key is the (key, symmetry) of the position, computed when missing.
+    stats: MoveStats counting the nodes, see stats.py
+    evaluator: IncrementalEvaluator of the position, made when missing and kept in step with the moves
+    '''
+    if stats is not None:
+        stats.count('nodes')
+    bitboards = game.get_bitboards()
+    to_move = game.get_current_player()
+    if evaluator is None:
+        evaluator = IncrementalEvaluator(*bitboards)
+    # the player who is not to move made the last move
+    if depth == 0 or game.check_winner(1 - to_move) != -1:
+        # the line score is the same for both players
+        return evaluator.score
+    if tt is not None:
+        if tt_key is None:
+            tt_key = tt.key(bitboards[0], bitboards[1], to_move)
+        entry = tt.probe(*tt_key)
+        # without pruning every stored value is exact
+        if entry is not None and entry.depth >= depth:
+            return entry.value
+    if depth == 1:
+        # the children are all leaves, score them from the line counts without playing them
+        move_ids = legal_move_ids(bitboards[1 - to_move])
+        if move_ids:
+            if stats is not None:
+                stats.count('nodes', len(move_ids))
+            scores = [score for score, _ in evaluator.children(bitboards[0], bitboards[1], to_move, move_ids)]
+            value = max(scores) if is_maximizing else min(scores)
+            if tt is not None:
+                tt.store(tt_key[0], depth, EXACT, value)
+            return value
     
     if is_maximizing:
         max_eval = float('-inf')
-        for move in get_possible_moves(board, player_marker):
-            new_board = Game.my_make_move(board, move, player_marker)
-            eval = minimax(new_board, depth - 1, False, player_marker, opponent_marker)
+        for move in unique_moves(bitboards[0], bitboards[1], to_move):
+            token = game.apply(move)
+            if token is None:
+                continue
+            evaluator.apply(bitboards[0], bitboards[1], to_move, MOVE_IDS[move])
+            child_key = tt.child_key(tt_key[0], bitboards, game.get_bitboards(), 1 - to_move) if tt is not None else None
+            eval = minimax(game, depth - 1, False, player_marker, opponent_marker, tt, child_key, stats, evaluator)
+            evaluator.undo()
+            game.undo(token)
             max_eval = max(max_eval, eval)
-        return max_eval
+        value = max_eval
     else:
         min_eval = float('inf')
-        for move in get_possible_moves(board, opponent_marker):
-            new_board = Game.my_make_move(board, move, opponent_marker)
-            eval = minimax(new_board, depth - 1, True, player_marker, opponent_marker)
+        for move in unique_moves(bitboards[0], bitboards[1], to_move):
+            token = game.apply(move)
+            if token is None:
+                continue
+            evaluator.apply(bitboards[0], bitboards[1], to_move, MOVE_IDS[move])
+            child_key = tt.child_key(tt_key[0], bitboards, game.get_bitboards(), 1 - to_move) if tt is not None else None
+            eval = minimax(game, depth - 1, True, player_marker, opponent_marker, tt, child_key, stats, evaluator)
+            evaluator.undo()
+            game.undo(token)
             min_eval = min(min_eval, eval)
-        return min_eval
+        value = min_eval
+    if tt is not None:
+        tt.store(tt_key[0], depth, EXACT, value)
+    return value
     
 
 
-def get_possible_moves(board, player_marker) -> tuple[tuple[int, int], Move] :
-    possible_moves = []
-    
-    for j in range(5):
-        for i in range(5):
-            # Check if cube is on the perimeter and is neutral or belongs to the player
-            if (i == 0 or i == 4 or j == 0 or j == 4) and (board[i][j] == player_marker or board[i][j] == -1):
-                # Map string directions to Move enum values
-                direction_map = {
-                    'top': Move.TOP,
-                    'bottom': Move.BOTTOM,
-                    'left': Move.LEFT,
-                    'right': Move.RIGHT
-                }
-                
-                # Add moves for placing the line in each direction
-                for direction_str, direction_enum in direction_map.items():
-                    if is_valid_place( (i, j), direction_str):
-                        possible_moves.append(((i, j), direction_enum))
-    
-    return possible_moves
-
-def is_valid_place( selected_cube, direction):
-    #double check it
-
-    i, j = selected_cube
-    # Check if the selected cube is in the top-left corner
-    if (i, j) == (4, 4) and (direction == 'right' or direction == 'bottom'):
-        return False
-    # Check if the selected cube is in the top-right corner
-    if (i, j) == (0, 4) and (direction == 'left' or direction == 'bottom'):
-        return False
-    # Check if the selected cube is in the bottom-left corner
-    if (i, j) == (4, 0) and (direction == 'right' or direction == 'top'):
-        return False
-    # Check if the selected cube is in the bottom-right corner
-    if (i, j) == (0, 0) and (direction == 'left' or direction == 'top'):
-        return False
-    # Check if the selected cube is on the top edge
-    if i == 4 and direction == 'right':
-        return False
-    # Check if the selected cube is on the bottom edge
-    if i == 0 and direction == 'left':
-        return False
-    # Check if the selected cube is on the left edge
-    if j == 4 and direction == 'bottom':
-        return False
-    # Check if the selected cube is on the right edge
-    if j == 0 and direction == 'top':
-        return False
-    return True
-
-def game_over(board):
-    # Check for win in rows and columns
-    for i in range(5):
-        if all(board[i][j] == 'X' for j in range(5)) or all(board[j][i] == 'X' for j in range(5)):
-            return True, 'X'
-        if all(board[i][j] == 'O' for j in range(5)) or all(board[j][i] == 'O' for j in range(5)):
-            return True, 'O'
-    
-    # Check for win in diagonals
-    if all(board[i][i] == 'X' for i in range(5)) or all(board[i][4-i] == 'X' for i in range(5)):
-        return True, 'X'
-    if all(board[i][i] == 'O' for i in range(5)) or all(board[i][4-i] == 'O' for i in range(5)):
-        return True, 'O'
-    
-    # Check for draw (all cells filled and no winner)
-    if all(cell in ['X', 'O'] for row in board for cell in row):
-        return True, 'Draw'
-    
-    return False, None
-
-
-def evaluate_board(board, player_marker) ->int:
-    # Initialize score
-    score = 0
-
-    # Define opponent's marker for convenience
-    opponent_marker = 'O' if player_marker == 'X' else 'X'
-
-    # Check rows and columns for potential wins or blocks
-    for i in range(5):  # Assuming a 5x5 Quixo board
-        row_score = 0
-        col_score = 0
-        for j in range(5):
-            # Check rows
-            if board[i][j] == player_marker:
-                row_score += 1
-            elif board[i][j] == opponent_marker:
-                row_score -= 1
-
-            # Check columns
-            if board[j][i] == player_marker:
-                col_score += 1
-            elif board[j][i] == opponent_marker:
-                col_score -= 1
-
-        score += row_score**2  # Square the row score to prioritize higher alignments
-        score += col_score**2  # Square the column score for the same reason
-
-    # Check diagonals for potential wins or blocks
-    diag1_score = 0
-    diag2_score = 0
-    for i in range(5):
-        # Primary diagonal
-        if board[i][i] == player_marker:
-            diag1_score += 1
-        elif board[i][i] == opponent_marker:
-            diag1_score -= 1
-
-        # Secondary diagonal
-        if board[i][4-i] == player_marker:
-            diag2_score += 1
-        elif board[i][4-i] == opponent_marker:
-            diag2_score -= 1
-
-    score += diag1_score**2
-    score += diag2_score**2
-
-    # Return the final score
-    return score
-
 if __name__ == '__main__':
+    import os
 
-    def simulate_games(num_simulations=100):
-        my_player_wins = 0
-        for _ in range(num_simulations):
-            game = Game()  # Initialize a new game for each simulation
-            player1 = MyPlayer()  # Your implementation
-            player2 = RandomPlayer()  # Random player as the opponent
-            winner = game.play(player1, player2)  # Play out the game
-            if winner == 0:  # Check if MyPlayer (assuming player1 is MyPlayer and wins as player 0)
-                my_player_wins += 1
-        return my_player_wins
-
-    # Run the simulation
+    from tournament import run
+
+    # Run the simulation, MyPlayer and the random player taking turns to move first
     num_simulations = 100
-    my_player_wins = simulate_games(num_simulations)
+    summary = run(['minimax', 'random'], num_simulations, workers=os.cpu_count())
+    my_player_wins = summary['players']['minimax']['wins']
 
     print(f"MyPlayer won {my_player_wins} out of {num_simulations} games.")
-
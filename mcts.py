@@ -0,0 +1,408 @@
+'''
+Monte Carlo tree search for the monte-carlo.py player, with its parallel variants.
+
+The tree is stored in arrays, see tree.py: nodes are indices and every node keeps its
+position, so a rollout starts from the selected leaf directly. Two parallel modes run
+on a process pool:
+
+- root parallelization grows independent trees in the workers and adds up the visit
+  and win counts of their root moves;
+- leaf parallelization selects several leaves in this process, keeping the paths apart
+  with a virtual loss, and has the workers run a batch of rollouts from each leaf.
+
+Worker code lives here rather than in monte-carlo.py, which cannot be imported by name.
+'''
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bitboard import pack
+from movegen import MOVES, legal_move_ids
+from playout import MAX_PLIES, RolloutPolicy
+from tree import NO_NODE, ROOT, Tree
+
+# log of the visit counts below LOG_TABLE_SIZE, larger counts call math.log
+LOG_TABLE_SIZE = 1 << 16
+_LOG_VISITS = (0.0,) + tuple(math.log(visits) for visits in range(1, LOG_TABLE_SIZE))
+# rollouts per leaf sent to a worker in leaf parallelization
+LEAF_BATCH = 32
+
+
+class MCTS(object):
+    '''
+    num_simulations: iterations per search
+    time_limit: seconds per search, None for no limit; the search stops at whichever comes first
+    max_plies: length of a rollout before it is scored with a heuristic
+    reuse_tree: whether best_move keeps the subtree of its move for the next turn
+    rollout: RolloutPolicy choosing the moves of the rollouts, uniformly random ones cut at max_plies by default
+    '''
+
+    def __init__(self, num_simulations=100, time_limit=None, max_plies=MAX_PLIES, reuse_tree=True, rollout=None):
+        self.num_simulations = num_simulations
+        self.time_limit = time_limit
+        self.max_plies = max_plies
+        self.reuse_tree = reuse_tree
+        self.rollout = rollout if rollout is not None else RolloutPolicy(cutoff=max_plies)
+        # tree of the last search and the node of the move played from its root
+        self._kept = None
+
+    def calculate_exploration_constant(self, tree, node):
+        # Example: Adjust C based on the depth of the node
+        depth = self.get_node_depth(tree, node)
+        if depth < 10:
+            return math.sqrt(2) + 0.75  # Encourage exploration in early game
+        else:
+            return 1.0  # Focus more on exploitation in later game
+
+    def get_node_depth(self, tree, node):
+        # stored when the node is added
+        return int(tree.depth[node])
+
+    def select(self, tree, node) -> int:
+        '''Returns the child with the highest UCB1 score, scoring the whole block of children at once'''
+        C = self.calculate_exploration_constant(tree, node)
+        node_visits = int(tree.visits[node])
+        log_visits = _LOG_VISITS[node_visits] if node_visits < LOG_TABLE_SIZE else math.log(node_visits)
+        first = int(tree.first_child[node])
+        last = first + int(tree.child_count[node])
+        visits = tree.visits[first:last]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ucb1_scores = tree.wins[first:last] / visits + C * np.sqrt(log_visits / visits)
+        # children never visited come first
+        ucb1_scores[visits == 0] = np.inf
+        # argmax keeps the first of equal scores
+        return first + int(ucb1_scores.argmax())
+
+
+
+    def simulate(self, board0, board1, to_move) -> int:
+        '''Plays a rollout from the position with the rollout policy, see playout.py; -1 for a draw'''
+        return self.rollout(board0, board1, to_move)[0]
+
+
+
+    def outcome(self, tree, node) -> tuple[int, int]:
+        '''(winner, rollout plies) of an iteration ending at node: the real result if the game is over there, a rollout otherwise'''
+        winner = tree.winner(node)
+        if winner != -1:
+            return winner, 0
+        return self.rollout(*tree.board(node))
+
+    def backpropagate(self, tree, node, result, player_id):
+        """
+        Update the statistics for nodes up the tree.
+
+        Parameters:
+        - tree, node: The starting node from which to backpropagate.
+        - result: The outcome of the simulation (1 if the player associated with the node won, 0 for a loss, and some other convention for a draw, if applicable).
+        """
+        win = result == player_id
+        # Traverse up the tree from the node to the root
+        while node != NO_NODE:
+            # Update the node's visit count
+            tree.visits[node] += 1
+            # Update the win count if the result indicates a win for the root player
+            if win:
+                tree.wins[node] += 1
+            # Go up to the parent node
+            node = tree.parent[node]
+
+
+
+    def select_best_move(self, tree, root=ROOT):
+        """Select the child with the highest win rate, None if the root has no child."""
+        children = tree.children(root)
+        if not children:
+            return None
+        winrates = tree.wins[children.start:children.stop] / tree.visits[children.start:children.stop]
+        return children.start + int(winrates.argmax())
+
+    def descend(self, tree, node=ROOT):
+        '''Selection and expansion: returns the leaf to run a rollout from'''
+        return self.expand(tree, self.walk(tree, node))
+
+    def walk(self, tree, node=ROOT):
+        '''Selection: follows the UCB1 choices down to a node with untried moves or without children'''
+        while not tree.untried[node] and tree.child_count[node]:
+            node = self.select(tree, node)
+        return node
+
+    def expand(self, tree, node):
+        '''Expansion: adds a child for a random untried move of node and returns it, or node if there is none'''
+        untried = int(tree.untried[node])
+        if untried:
+            # uniform choice among the set bits
+            for _ in range(random.randrange(untried.bit_count())):
+                untried &= untried - 1
+            node = tree.add_child(node, (untried & -untried).bit_length() - 1)
+        return node
+
+    def search(self, game, num_simulations=None, deadline=None, tree=None, stats=None) -> Tree:
+        '''
+        Grows a tree from the position of game and returns it.
+        deadline is a time.time() timestamp, None for no limit. The game is not modified.
+        tree continues the search of an existing tree of that position.
+        stats: MoveStats receiving the counters and phase timings, see stats.py
+        '''
+        if num_simulations is None:
+            num_simulations = self.num_simulations
+        if tree is None:
+            tree = Tree(*game.get_bitboards(), game.get_current_player())
+        elif stats is not None:
+            stats.count('reused_nodes', tree.size)
+        return self.grow(tree, num_simulations, deadline, stats)
+
+    def grow(self, tree, num_simulations, deadline=None, stats=None) -> Tree:
+        '''Runs num_simulations iterations on tree, or fewer if the deadline passes first'''
+        if stats is not None:
+            return self._grow_measured(tree, num_simulations, deadline, stats)
+        player_id = tree.to_move(ROOT)
+        for _ in range(num_simulations):
+            if deadline is not None and time.time() >= deadline:
+                break
+            node = self.descend(tree)
+            #simulation, unless the game is over at the leaf
+            winner = self.outcome(tree, node)[0]
+            #backpropagation
+            self.backpropagate(tree, node, winner, player_id)
+        return tree
+
+    def _grow_measured(self, tree, num_simulations, deadline, stats) -> Tree:
+        '''grow, timing each phase and counting the simulations and rollout plies into stats'''
+        player_id = tree.to_move(ROOT)
+        timings = [0.0, 0.0, 0.0, 0.0]
+        simulations = rollout_plies = 0
+        clock = time.perf_counter
+        for _ in range(num_simulations):
+            if deadline is not None and time.time() >= deadline:
+                break
+            start = clock()
+            node = self.walk(tree)
+            selected = clock()
+            node = self.expand(tree, node)
+            expanded = clock()
+            winner, plies = self.outcome(tree, node)
+            simulated = clock()
+            self.backpropagate(tree, node, winner, player_id)
+            timings[0] += selected - start
+            timings[1] += expanded - selected
+            timings[2] += simulated - expanded
+            timings[3] += clock() - simulated
+            simulations += 1
+            rollout_plies += plies
+        for name, seconds in zip(('selection', 'expansion', 'simulation', 'backpropagation'), timings):
+            stats.add_time(name, seconds)
+        stats.count('simulations', simulations)
+        stats.count('rollout_plies', rollout_plies)
+        stats.count('tree_nodes', tree.size)
+        return tree
+
+    def best_move(self, game, stats=None):
+        '''Returns the chosen ((X, Y), Move) for the current player of game, stats as in search'''
+        deadline = time.time() + self.time_limit if self.time_limit is not None else None
+        tree = self.search(game, deadline=deadline, tree=self.tree_for(game), stats=stats)
+        best_child = self.select_best_move(tree)
+        self.keep_subtree(tree, best_child)
+        if best_child is None:
+            return first_legal_move(game)
+        return MOVES[tree.move_id[best_child]]
+
+    def tree_for(self, game) -> Tree | None:
+        '''
+        Returns the subtree of the kept move whose root is the position of game, i.e. the reply
+        the opponent played to our last move, copied out of the old tree. None if there is none.
+        '''
+        kept, self._kept = self._kept, None
+        if kept is None:
+            return None
+        tree, node = kept
+        current = pack(*game.get_bitboards(), game.get_current_player())
+        for child in tree.children(node):
+            if tree.position[child] == current:
+                # the rest of the old tree is freed with it
+                return tree.subtree(child)
+        return None
+
+    def keep_subtree(self, tree, child) -> None:
+        '''Keeps the subtree of child, the move about to be played, for the next tree_for call'''
+        if self.reuse_tree and child is not None:
+            self._kept = (tree, child)
+
+
+def first_legal_move(game):
+    '''The move played when a search ends before its first simulation, e.g. at a deadline already past'''
+    board0, board1 = game.get_bitboards()
+    return MOVES[legal_move_ids((board0, board1)[1 - game.get_current_player()])[0]]
+
+
+# rollout policy of the worker process, received once when the pool starts
+_worker_rollout = None
+
+
+def _init_worker(rollout: RolloutPolicy) -> None:
+    global _worker_rollout
+    _worker_rollout = rollout
+
+
+def _grow_tree(board0: int, board1: int, to_move: int, num_simulations: int, deadline: float | None,
+               seed: int) -> tuple[dict[int, tuple[int, int]], tuple[int, int, float]]:
+    '''
+    Worker task of root parallelization: returns {move_id: (visits, wins)} of the root moves,
+    with the counters of the rollouts, see RolloutPolicy.counters
+    '''
+    random.seed(seed)
+    # the policy is a copy, it counts the rollouts of this task only
+    rollout = _worker_rollout
+    rollout.reset()
+    tree = MCTS(rollout=rollout).grow(Tree(board0, board1, to_move), num_simulations, deadline)
+    root_moves = {int(tree.move_id[child]): (int(tree.visits[child]), int(tree.wins[child])) for child in tree.children(ROOT)}
+    return root_moves, rollout.counters()
+
+
+def _rollouts(board0: int, board1: int, to_move: int, count: int, seed: int) -> tuple[list[int], tuple[int, int, float]]:
+    '''
+    Worker task of leaf parallelization: returns the winners of count rollouts from the position,
+    with the counters of the rollouts, see RolloutPolicy.counters
+    '''
+    random.seed(seed)
+    rollout = _worker_rollout
+    rollout.reset()
+    return [rollout(board0, board1, to_move)[0] for _ in range(count)], rollout.counters()
+
+
+class ParallelMCTS(MCTS):
+    '''
+    MCTS over a pool of worker processes, started on the first search.
+    mode: 'root' for independent trees merged at the root, 'leaf' for batched rollouts
+    leaf_batch: rollouts per selected leaf in leaf mode; a task costs a round trip to a worker,
+        so small batches spend more time passing messages than playing
+    Both modes run num_simulations rollouts in all. Only leaf mode reuses its tree across turns,
+    root mode has no tree in this process. The rollout policy reaches the workers once, when
+    the pool starts, rather than with every task.
+    '''
+
+    def __init__(self, workers, num_simulations=100, time_limit=None, mode='root', leaf_batch=LEAF_BATCH, max_plies=MAX_PLIES,
+                 reuse_tree=True, rollout=None):
+        if mode not in ('root', 'leaf'):
+            raise ValueError(f"unknown parallel MCTS mode {mode!r}")
+        super().__init__(num_simulations, time_limit, max_plies, reuse_tree, rollout)
+        self.workers = workers
+        self.mode = mode
+        self.leaf_batch = leaf_batch
+        self._pool = None
+
+    def best_move(self, game, stats=None):
+        '''Returns the chosen ((X, Y), Move) for the current player of game, stats as in MCTS.search'''
+        deadline = time.time() + self.time_limit if self.time_limit is not None else None
+        if self.mode == 'root':
+            return self.root_parallel(game, deadline, stats)
+        tree = self.leaf_parallel(game, deadline, self.tree_for(game), stats)
+        best_child = self.select_best_move(tree)
+        self.keep_subtree(tree, best_child)
+        if best_child is None:
+            return first_legal_move(game)
+        return MOVES[tree.move_id[best_child]]
+
+    def root_parallel(self, game, deadline=None, stats=None):
+        '''Grows one tree per worker and picks the root move with the best merged win rate'''
+        board0, board1 = game.get_bitboards()
+        to_move = game.get_current_player()
+        pool = self._executor()
+        share, extra = divmod(self.num_simulations, self.workers)
+        futures = [
+            pool.submit(_grow_tree, board0, board1, to_move, share + (worker < extra), deadline, random.getrandbits(32))
+            for worker in range(self.workers)
+        ]
+        totals = {}
+        for future in futures:
+            root_moves, counters = future.result()
+            self._add_rollouts(counters, stats)
+            for move_id, (visits, wins) in root_moves.items():
+                total_visits, total_wins = totals.get(move_id, (0, 0))
+                totals[move_id] = (total_visits + visits, total_wins + wins)
+        if stats is not None:
+            stats.count('simulations', sum(visits for visits, _ in totals.values()))
+        if not totals:
+            # no worker finished a simulation before the deadline
+            return first_legal_move(game)
+        # same rule as select_best_move, over the merged counts
+        best_move_id = max(totals, key=lambda move_id: totals[move_id][1] / totals[move_id][0])
+        return MOVES[best_move_id]
+
+    def leaf_parallel(self, game, deadline=None, tree=None, stats=None) -> Tree:
+        '''
+        Selects one leaf per worker, then runs leaf_batch rollouts from each on the pool.
+        While a batch is out, every node on its path carries one virtual visit without a win,
+        which lowers its UCB score and steers the next selection elsewhere.
+        tree continues the search of an existing tree of the position.
+        stats receives the simulations, the tree size and the rollout plies and seconds of the workers.
+        '''
+        if tree is None:
+            tree = Tree(*game.get_bitboards(), game.get_current_player())
+        player_id = tree.to_move(ROOT)
+        pool = self._executor()
+        simulations = 0
+        while simulations < self.num_simulations:
+            if deadline is not None and time.time() >= deadline:
+                break
+            batch = []
+            # rollouts not sent yet, the last batches are cut to num_simulations
+            remaining = self.num_simulations - simulations
+            for _ in range(self.workers):
+                count = min(self.leaf_batch, remaining)
+                if count <= 0:
+                    break
+                remaining -= count
+                node = self.descend(tree)
+                winner = tree.winner(node)
+                if winner != -1:
+                    # the game is over at the leaf: its real result, without rollouts
+                    for _ in range(count):
+                        self.backpropagate(tree, node, winner, player_id)
+                    simulations += count
+                    continue
+                # later expansions may move the leaf, its path finds it again
+                batch.append((tree.path(node), pool.submit(
+                    _rollouts, *tree.board(node), count, random.getrandbits(32)
+                )))
+                # virtual loss
+                path = node
+                while path != NO_NODE:
+                    tree.visits[path] += 1
+                    path = tree.parent[path]
+            for path, future in batch:
+                node = path = tree.follow(path)
+                while path != NO_NODE:
+                    tree.visits[path] -= 1
+                    path = tree.parent[path]
+                winners, counters = future.result()
+                self._add_rollouts(counters, stats)
+                for winner in winners:
+                    self.backpropagate(tree, node, winner, player_id)
+                simulations += len(winners)
+        if stats is not None:
+            stats.count('simulations', simulations)
+            stats.count('tree_nodes', tree.size)
+        return tree
+
+    def _add_rollouts(self, counters, stats) -> None:
+        '''Adds the rollout counters of a worker task to the policy and to stats, the seconds being worker time'''
+        self.rollout.add(counters)
+        if stats is not None:
+            _, plies, seconds = counters
+            stats.count('rollout_plies', plies)
+            stats.add_time('simulation', seconds)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.rollout,))
+        return self._pool
+
+    def close(self) -> None:
+        '''Stops the worker processes'''
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
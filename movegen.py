@@ -0,0 +1,93 @@
+'''
+Move generation shared by all the players.
+
+A move can take any perimeter cube that is neutral or owned by the mover, so the
+legal moves only depend on which perimeter cubes the opponent owns. The 44
+(position, Move) pairs are listed once in MOVES, in the order of bitboard.MOVES, and
+the legal subset for a given opponent bitboard is found with a mask AND and a
+cached table lookup.
+'''
+import numpy as np
+
+import bitboard
+from game import Move
+from symmetry import unique_move_ids
+
+# move id -> ((X, Y), Move), the format returned by Player.make_move
+MOVES = tuple(((x, y), Move(direction)) for x, y, direction in bitboard.MOVES)
+MOVE_IDS = {move: move_id for move_id, move in enumerate(MOVES)}
+
+# perimeter bit -> ids of the moves taking that cube
+_CELL_MOVES = {}
+for _move_id, _source in enumerate(bitboard.SOURCE):
+    _CELL_MOVES[_source] = _CELL_MOVES.get(_source, ()) + (_move_id,)
+
+# perimeter bit -> bitmask of the ids of the moves taking that cube
+_CELL_MOVE_MASKS = {source: sum(1 << move_id for move_id in move_ids) for source, move_ids in _CELL_MOVES.items()}
+
+# free perimeter mask -> legal move ids, filled on demand (at most 2^16 entries)
+_LEGAL_IDS: dict[int, tuple[int, ...]] = {}
+_LEGAL_MOVES: dict[int, tuple[tuple[tuple[int, int], Move], ...]] = {}
+
+
+def iter_legal_move_ids(opponent: int):
+    '''Yields the ids of the legal moves one at a time, so a search can stop early'''
+    free = bitboard.PERIMETER & ~opponent
+    while free:
+        low = free & -free
+        yield from _CELL_MOVES[low]
+        free ^= low
+
+
+def legal_move_ids(opponent: int) -> tuple[int, ...]:
+    '''Returns the ids of the legal moves for the player facing the opponent bitboard'''
+    free = bitboard.PERIMETER & ~opponent
+    move_ids = _LEGAL_IDS.get(free)
+    if move_ids is None:
+        move_ids = _LEGAL_IDS[free] = tuple(iter_legal_move_ids(opponent))
+    return move_ids
+
+
+def legal_move_mask(opponent: int) -> int:
+    '''Returns the legal move ids for the player facing the opponent bitboard, as a bitmask'''
+    free = bitboard.PERIMETER & ~opponent
+    mask = 0
+    while free:
+        low = free & -free
+        mask |= _CELL_MOVE_MASKS[low]
+        free ^= low
+    return mask
+
+
+def iter_legal_moves(opponent: int):
+    '''Yields the legal ((X, Y), Move) pairs one at a time'''
+    for move_id in iter_legal_move_ids(opponent):
+        yield MOVES[move_id]
+
+
+def legal_moves(opponent: int) -> tuple[tuple[tuple[int, int], Move], ...]:
+    '''Returns the legal ((X, Y), Move) pairs for the player facing the opponent bitboard'''
+    free = bitboard.PERIMETER & ~opponent
+    moves = _LEGAL_MOVES.get(free)
+    if moves is None:
+        moves = _LEGAL_MOVES[free] = tuple(MOVES[move_id] for move_id in legal_move_ids(opponent))
+    return moves
+
+
+def unique_moves(board0: int, board1: int, mover: int) -> tuple[tuple[tuple[int, int], Move], ...]:
+    '''
+    Returns the legal moves of mover in the order of legal_moves, keeping one move of each set
+    that a symmetry of the position maps onto each other, see symmetry.unique_move_ids.
+    '''
+    opponent = (board0, board1)[1 - mover]
+    move_ids = legal_move_ids(opponent)
+    unique = unique_move_ids(board0, board1, move_ids)
+    if len(unique) == len(move_ids):
+        return legal_moves(opponent)
+    return tuple(MOVES[move_id] for move_id in unique)
+
+
+def get_possible_moves(board: np.ndarray, player_marker: int) -> list[tuple[tuple[int, int], Move]]:
+    '''Returns the legal moves of player_marker on a 5x5 board, as a list the caller may modify'''
+    bitboards = bitboard.from_array(board)
+    return list(legal_moves(bitboards[1 - player_marker]))
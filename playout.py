@@ -0,0 +1,233 @@
+'''
+Random playout kernel for the Monte Carlo players.
+
+A playout runs on two ints, the bitboards of the player to move and of the other
+player, swapped after every move, so nothing is allocated per ply. Moves are drawn
+by rejection: a random move id out of the 44 is redrawn until its source cube is not
+the opponent's, which keeps the choice uniform over the legal moves without
+building their list. The move itself is applied with the precomputed table of
+bitboard.py and the winner is found with the shifted-AND line tests.
+
+A playout that reaches max_plies without a winner is decided by open_line_score.
+
+guided_playout_plies trades speed for better informed rollouts: it can play the move
+with the best open_line_score balance, take immediate wins, avoid immediate losses and
+block threats. RolloutPolicy holds such a configuration with the playouts, plies and
+time it spent, and is what the MCTS players call.
+'''
+import random
+import time
+
+import bitboard
+from movegen import legal_move_ids
+
+# plies after which a playout is stopped and scored
+MAX_PLIES = 200
+
+_MOVE_COUNT = len(bitboard.MOVES)
+_SOURCE = bitboard.SOURCE
+_APPLY = bitboard._APPLY
+_PERIMETER = bitboard.PERIMETER
+_LINES = bitboard.LINES
+_has_line = bitboard.has_line
+
+
+def open_line_score(player: int, opponent: int) -> int:
+    '''Sum of the squared cube counts of the player on the lines the opponent has no cube on'''
+    score = 0
+    for line in _LINES:
+        if not opponent & line:
+            count = (player & line).bit_count()
+            score += count * count
+    return score
+
+
+def playout(board0: int, board1: int, to_move: int, max_plies: int = MAX_PLIES, rng=random.random) -> int:
+    '''
+    Plays uniformly random legal moves from the position and returns the winner, at once if
+    the position already has a line.
+    When max_plies pass without a winner, the player with the higher open_line_score wins,
+    and a tie or a player without legal moves gives -1.
+    rng returns floats in [0, 1), by default from the random module so random.seed applies.
+    '''
+    return playout_plies(board0, board1, to_move, max_plies, rng)[0]
+
+
+def playout_plies(board0: int, board1: int, to_move: int, max_plies: int = MAX_PLIES, rng=random.random) -> tuple[int, int]:
+    '''Same as playout, returns (winner, plies played)'''
+    # the last move may already have ended the game
+    winner = bitboard.winner(board0, board1, 1 - to_move)
+    if winner != -1:
+        return winner, 0
+    if to_move == 0:
+        mover, opponent = board0, board1
+    else:
+        mover, opponent = board1, board0
+    for ply in range(max_plies):
+        if not _PERIMETER & ~opponent:
+            return -1, ply
+        move_id = int(rng() * _MOVE_COUNT)
+        while _SOURCE[move_id] & opponent:
+            move_id = int(rng() * _MOVE_COUNT)
+        keep, segment, shl, shr, destination = _APPLY[move_id]
+        mover, opponent = (
+            (mover & keep) | (((mover & segment) << shl) >> shr) | destination,
+            (opponent & keep) | (((opponent & segment) << shl) >> shr),
+        )
+        # completing a line for the opponent loses, even with one of the mover's own
+        if _has_line(opponent):
+            return 1 - to_move, ply + 1
+        if _has_line(mover):
+            return to_move, ply + 1
+        mover, opponent = opponent, mover
+        to_move = 1 - to_move
+    return _cutoff_winner(mover, opponent, to_move), max_plies
+
+
+def _cutoff_winner(mover: int, opponent: int, to_move: int) -> int:
+    mover_score = open_line_score(mover, opponent)
+    opponent_score = open_line_score(opponent, mover)
+    if mover_score == opponent_score:
+        return -1
+    return to_move if mover_score > opponent_score else 1 - to_move
+
+
+def _can_win(player: int, other: int) -> bool:
+    '''Whether player, to move, has a move completing a line for itself only'''
+    for move_id in legal_move_ids(other):
+        keep, segment, shl, shr, destination = _APPLY[move_id]
+        if _has_line((player & keep) | (((player & segment) << shl) >> shr) | destination) and not _has_line(
+            (other & keep) | (((other & segment) << shl) >> shr)
+        ):
+            return True
+    return False
+
+
+def _guided_move(mover: int, opponent: int, move_ids: tuple[int, ...], explore: bool, tactics: bool, block: bool,
+                 rng) -> tuple[int, int]:
+    '''Returns the (mover, opponent) bitboards after the move chosen among move_ids, see guided_playout_plies'''
+    candidates = []
+    losing = None
+    for move_id in move_ids:
+        keep, segment, shl, shr, destination = _APPLY[move_id]
+        after = (
+            (mover & keep) | (((mover & segment) << shl) >> shr) | destination,
+            (opponent & keep) | (((opponent & segment) << shl) >> shr),
+        )
+        if tactics:
+            if _has_line(after[1]):
+                losing = losing or after
+                continue
+            if _has_line(after[0]):
+                return after
+        candidates.append(after)
+    if not candidates:
+        # every move completes a line for the opponent
+        return losing
+    if explore:
+        index = int(rng() * len(candidates))
+        candidates[0], candidates[index] = candidates[index], candidates[0]
+    else:
+        candidates.sort(key=lambda after: open_line_score(*after) - open_line_score(after[1], after[0]), reverse=True)
+    if block:
+        # the preferred move that leaves the opponent without a winning reply
+        for after in candidates:
+            if not _can_win(after[1], after[0]):
+                return after
+    return candidates[0]
+
+
+def guided_playout_plies(board0: int, board1: int, to_move: int, max_plies: int = MAX_PLIES, epsilon: float = 0.0,
+                         tactics: bool = True, block: bool = False, rng=random.random) -> tuple[int, int]:
+    '''
+    Same as playout_plies, with the moves chosen as described by RolloutPolicy.
+    Every ply that is not random scores all the legal moves, so a ply costs tens of times a random one.
+    '''
+    # the tactics only look at the lines of the next move, not at a game already over
+    winner = bitboard.winner(board0, board1, 1 - to_move)
+    if winner != -1:
+        return winner, 0
+    if to_move == 0:
+        mover, opponent = board0, board1
+    else:
+        mover, opponent = board1, board0
+    for ply in range(max_plies):
+        move_ids = legal_move_ids(opponent)
+        if not move_ids:
+            return -1, ply
+        explore = rng() < epsilon
+        if explore and not tactics and not block:
+            keep, segment, shl, shr, destination = _APPLY[move_ids[int(rng() * len(move_ids))]]
+            mover, opponent = (
+                (mover & keep) | (((mover & segment) << shl) >> shr) | destination,
+                (opponent & keep) | (((opponent & segment) << shl) >> shr),
+            )
+        else:
+            mover, opponent = _guided_move(mover, opponent, move_ids, explore, tactics, block, rng)
+        if _has_line(opponent):
+            return 1 - to_move, ply + 1
+        if _has_line(mover):
+            return to_move, ply + 1
+        mover, opponent = opponent, mover
+        to_move = 1 - to_move
+    return _cutoff_winner(mover, opponent, to_move), max_plies
+
+
+class RolloutPolicy(object):
+    '''
+    How rollouts choose their moves.
+    epsilon: probability of a uniformly random move at each ply, the other plies playing the move
+        with the best open_line_score balance for the mover; 1 plays at random
+    tactics: play a winning move when there is one, and never one completing a line for the opponent
+    block: when the opponent could win on its reply, prefer a move that takes that away
+    cutoff: plies after which the rollout is scored with open_line_score instead of played out
+    The default, uniformly random moves, runs the fast playout kernel.
+    The counters only see the rollouts of this object: a copy sent to another process counts
+    its own, which come back through counters and add.
+    '''
+
+    def __init__(self, epsilon: float = 1.0, tactics: bool = False, block: bool = False, cutoff: int = MAX_PLIES) -> None:
+        self.epsilon = epsilon
+        self.tactics = tactics
+        self.block = block
+        self.cutoff = cutoff
+        self.reset()
+
+    def reset(self) -> None:
+        '''Sets the counters back to zero'''
+        self.playouts = 0
+        self.plies = 0
+        self.seconds = 0.0
+
+    def counters(self) -> tuple[int, int, float]:
+        '''Returns (playouts, plies, seconds) so far'''
+        return self.playouts, self.plies, self.seconds
+
+    def add(self, counters: tuple[int, int, float]) -> None:
+        '''Adds the counters of a copy of the policy, see counters'''
+        playouts, plies, seconds = counters
+        self.playouts += playouts
+        self.plies += plies
+        self.seconds += seconds
+
+    def __call__(self, board0: int, board1: int, to_move: int, rng=random.random) -> tuple[int, int]:
+        '''Plays a rollout from the position and returns (winner, plies played)'''
+        start = time.perf_counter()
+        if self.epsilon >= 1 and not self.tactics and not self.block:
+            result = playout_plies(board0, board1, to_move, self.cutoff, rng)
+        else:
+            result = guided_playout_plies(
+                board0, board1, to_move, self.cutoff, self.epsilon, self.tactics, self.block, rng
+            )
+        self.playouts += 1
+        self.plies += result[1]
+        self.seconds += time.perf_counter() - start
+        return result
+
+    def stats(self) -> dict:
+        '''Playouts so far, their mean length and their throughput'''
+        return {
+            'playouts': self.playouts,
+            'mean_plies': self.plies / self.playouts if self.playouts else 0.0,
+            'playouts_per_second': self.playouts / self.seconds if self.seconds > 0 else 0.0,
+        }
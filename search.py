@@ -0,0 +1,431 @@
+'''
+Iterative-deepening alpha-beta search over bitboards.
+
+The search deepens one ply at a time until the depth limit or the time/node budget is
+reached, and answers with the best move of the deepest completed iteration. Every
+iteration searches first the moves that were best before: the stored move of the
+transposition table, then two killer moves per ply, then the rest by history score.
+The root shares its alpha-beta window across siblings. Moves that a symmetry of the
+position maps onto each other lead to the same value, so only one of them is searched.
+
+Values are from the point of view of the player to move at the root, as in the
+minimax players: the line-score heuristic of evaluation.py, and +/- WIN (minus the
+distance in plies) for won and lost positions.
+'''
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bitboard
+from endgame import DRAW, WIN as SOLVED_WIN, EndgameTable
+from evaluation import IncrementalEvaluator
+from movegen import MOVES, legal_move_ids
+from symmetry import unique_move_ids
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+# larger than any heuristic score (12 lines scoring at most 5 ** 2)
+WIN = 1000
+# wins are recognised as such up to this many plies from the root
+MAX_PLY = 100
+# the budget is checked every this many nodes
+CHECK_EVERY = 256
+
+
+class SearchTimeout(Exception):
+    '''Raised inside the search when its time or node budget is spent'''
+
+
+def _to_tt(value: float, ply: int) -> float:
+    '''Win scores are stored relative to the node rather than to the root'''
+    if value >= WIN - MAX_PLY:
+        return value + ply
+    if value <= MAX_PLY - WIN:
+        return value - ply
+    return value
+
+
+def _from_tt(value: float, ply: int) -> float:
+    if value >= WIN - MAX_PLY:
+        return value - ply
+    if value <= MAX_PLY - WIN:
+        return value + ply
+    return value
+
+
+class AlphaBetaSearch(object):
+    '''
+    max_depth: deepest iteration, in plies
+    time_limit: seconds per search, None for no limit
+    node_limit: nodes per search, None for no limit
+    strict_depth: only use table entries searched to exactly the requested depth, so that
+        a fixed-depth result does not depend on what the table learnt before
+    endgame: solved positions without neutral cubes, see endgame.py; they are scored exactly
+    The first iteration always completes, so a move is returned whatever the budget.
+    '''
+
+    def __init__(self, max_depth: int = 4, time_limit: float | None = None, node_limit: int | None = None,
+                 tt_bits: int = 20, symmetric: bool = False, strict_depth: bool = False,
+                 endgame: EndgameTable | None = None) -> None:
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.strict_depth = strict_depth
+        self.endgame = endgame
+        self.tt = TranspositionTable(tt_bits, symmetric)
+        # line counts of the node being searched, applied and undone along with the moves
+        self.evaluator = IncrementalEvaluator(0, 0)
+        self.history = [0] * len(MOVES)
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.nodes = 0
+        # beta cutoffs of the last search
+        self.cutoffs = 0
+        self.player = None
+        self._deadline = None
+        self._next_check = CHECK_EVERY
+        self._can_stop = False
+
+    def search(self, board0: int, board1: int, to_move: int) -> tuple[int | None, float, int]:
+        '''
+        Searches the position and returns (move_id, value, depth) for the deepest completed
+        iteration. move_id is None when to_move has no legal move.
+        '''
+        self._new_search(to_move)
+        self.nodes = 0
+        self.cutoffs = 0
+        self._next_check = CHECK_EVERY
+        self._deadline = time.perf_counter() + self.time_limit if self.time_limit is not None else None
+        self._can_stop = False
+
+        key = self.tt.key(board0, board1, to_move)
+        self.evaluator.reset(board0, board1)
+        best = (None, float('-inf'), 0)
+        for depth in range(1, self.max_depth + 1):
+            try:
+                value, move_id = self._root(board0, board1, to_move, depth, key)
+            except SearchTimeout:
+                break
+            best = (move_id, value, depth)
+            self._can_stop = True
+            # a forced win or loss does not change with depth
+            if move_id is None or abs(value) >= WIN - MAX_PLY:
+                break
+        return best
+
+    def search_move(self, board0: int, board1: int, to_move: int, move_id: int, depth: int, alpha: float = float('-inf'),
+                    deadline: float | None = None, node_limit: int | None = None, new_search: bool = True) -> float | None:
+        '''
+        Returns the value of one root move searched to depth (the root move included) with the
+        window (alpha, +inf), or None if the budget ran out first. Values above alpha are exact.
+        deadline is a time.time() timestamp, so that it can be shared between processes.
+        new_search: whether this call starts the search of a new root position, which ages
+        the table and the move-ordering statistics
+        '''
+        if new_search or to_move != self.player:
+            self._new_search(to_move)
+        self.nodes = 0
+        self.cutoffs = 0
+        self._next_check = CHECK_EVERY
+        self._deadline = time.perf_counter() + (deadline - time.time()) if deadline is not None else None
+        saved_node_limit, self.node_limit = self.node_limit, node_limit
+        self._can_stop = True
+        bitboards = (board0, board1)
+        child = self._child(bitboards, to_move, move_id)
+        key = self.tt.key(child[0], child[1], 1 - to_move)
+        self.evaluator.reset(child[0], child[1])
+        try:
+            return self._minimax(child, 1 - to_move, depth - 1, 1, alpha, float('inf'), key)
+        except SearchTimeout:
+            return None
+        finally:
+            self.node_limit = saved_node_limit
+
+    def _new_search(self, to_move: int) -> None:
+        if to_move != self.player:
+            # values are scored for one side, so nothing learnt for the other side is reusable;
+            # before the first search the table is empty already
+            if self.player is not None:
+                self.tt.clear()
+            self.history = [0] * len(MOVES)
+            self.player = to_move
+        self.tt.new_search()
+        # keep the history ordering of previous moves, with less weight
+        self.history = [score // 2 for score in self.history]
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+
+    def _check_budget(self) -> None:
+        self._next_check = self.nodes + CHECK_EVERY
+        if not self._can_stop:
+            return
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise SearchTimeout()
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+
+    def _ordered_moves(self, bitboards: tuple[int, int], to_move: int, ply: int, tt_move: int | None) -> tuple[int, ...]:
+        '''
+        Stored move first, then the killers of the ply, then the rest by decreasing history score.
+        Of the moves that a symmetry of the position maps onto each other, only the first is kept.
+        '''
+        opponent = bitboards[1 - to_move]
+        first = []
+        for move_id in (tt_move, *self.killers[ply]):
+            if move_id is not None and move_id not in first and bitboard.is_legal(opponent, move_id):
+                first.append(move_id)
+        rest = sorted(legal_move_ids(opponent), key=self.history.__getitem__, reverse=True)
+        return unique_move_ids(bitboards[0], bitboards[1], first + [move_id for move_id in rest if move_id not in first])
+
+    def _root(self, board0: int, board1: int, to_move: int, depth: int, key: tuple[int, int]) -> tuple[float, int | None]:
+        '''Searches the root moves with a window shared across siblings'''
+        bitboards = (board0, board1)
+        entry = self.tt.probe(*key)
+        tt_move = entry.move_id if entry is not None else None
+        alpha = float('-inf')
+        best_move = None
+        for move_id in self._ordered_moves(bitboards, to_move, 0, tt_move):
+            child = self._child(bitboards, to_move, move_id)
+            self.evaluator.apply(board0, board1, to_move, move_id)
+            value = self._minimax(child, 1 - to_move, depth - 1, 1, alpha, float('inf'),
+                                  self.tt.child_key(key[0], bitboards, child, 1 - to_move))
+            self.evaluator.undo()
+            if value > alpha or best_move is None:
+                alpha, best_move = value, move_id
+        if best_move is not None:
+            self.tt.store(key[0], depth, EXACT, alpha, best_move, key[1])
+        return alpha, best_move
+
+    @staticmethod
+    def _child(bitboards: tuple[int, int], to_move: int, move_id: int) -> tuple[int, int]:
+        mover, opponent = bitboard.apply_move(bitboards[to_move], bitboards[1 - to_move], move_id)
+        return (mover, opponent) if to_move == 0 else (opponent, mover)
+
+    def _minimax(self, bitboards: tuple[int, int], to_move: int, depth: int, ply: int,
+                 alpha: float, beta: float, key: tuple[int, int]) -> float:
+        self.nodes += 1
+        if self.nodes >= self._next_check:
+            self._check_budget()
+        player = self.player
+        # the player who is not to move made the last move
+        winner = bitboard.winner(bitboards[0], bitboards[1], 1 - to_move)
+        if winner != -1:
+            return WIN - ply if winner == player else ply - WIN
+        if self.endgame is not None and bitboards[0] | bitboards[1] == bitboard.FULL:
+            solved = self.endgame.probe(bitboards[0], bitboards[1], to_move)
+            if solved is not None:
+                return self._solved_value(solved, to_move, ply)
+        if depth == 0:
+            return self.evaluator.score
+
+        tt_move = None
+        entry = self.tt.probe(*key)
+        if entry is not None:
+            if entry.depth == depth or entry.depth > depth and not self.strict_depth:
+                value = _from_tt(entry.value, ply)
+                if entry.flag == EXACT:
+                    return value
+                if entry.flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if beta <= alpha:
+                    return value
+            tt_move = entry.move_id
+        window_alpha, window_beta = alpha, beta
+        maximizing = to_move == player
+
+        if depth == 1:
+            return self._frontier(bitboards, to_move, ply, maximizing, key)
+
+        best_value = float('-inf') if maximizing else float('inf')
+        best_move = None
+        for move_id in self._ordered_moves(bitboards, to_move, ply, tt_move):
+            child = self._child(bitboards, to_move, move_id)
+            self.evaluator.apply(bitboards[0], bitboards[1], to_move, move_id)
+            value = self._minimax(child, 1 - to_move, depth - 1, ply + 1, alpha, beta,
+                                  self.tt.child_key(key[0], bitboards, child, 1 - to_move))
+            self.evaluator.undo()
+            if maximizing:
+                if value > best_value:
+                    best_value, best_move = value, move_id
+                alpha = max(alpha, value)
+            else:
+                if value < best_value:
+                    best_value, best_move = value, move_id
+                beta = min(beta, value)
+            if beta <= alpha:
+                self.cutoffs += 1
+                # remember the refutation for the siblings of this node and for later iterations
+                killers = self.killers[ply]
+                if killers[0] != move_id:
+                    killers[1], killers[0] = killers[0], move_id
+                self.history[move_id] += depth * depth
+                break
+
+        if best_move is None:
+            # no legal move: the position is scored as it stands
+            return self.evaluator.score
+        if best_value <= window_alpha:
+            flag = UPPER
+        elif best_value >= window_beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt.store(key[0], depth, flag, _to_tt(best_value, ply), best_move, key[1])
+        return best_value
+
+    def _solved_value(self, solved: tuple[int, int], to_move: int, ply: int) -> float:
+        '''Value of an endgame table result, the game ending distance plies after this node'''
+        result, distance = solved
+        if result == DRAW:
+            return 0
+        # the player to move wins or loses when the game ends
+        value = WIN - ply - distance
+        return value if (result == SOLVED_WIN) == (to_move == self.player) else -value
+
+    def _frontier(self, bitboards: tuple[int, int], to_move: int, ply: int, maximizing: bool, key: tuple[int, int]) -> float:
+        '''
+        The children are all leaves: score them from the line counts, without playing them,
+        except for the children without neutral cubes, found in the endgame table.
+        '''
+        player = self.player
+        move_ids = unique_move_ids(bitboards[0], bitboards[1], legal_move_ids(bitboards[1 - to_move]))
+        if not move_ids:
+            return self.evaluator.score
+        self.nodes += len(move_ids)
+        # a move fills the board only if at most one neutral cube is left, the one it takes
+        solvable = self.endgame is not None and (bitboards[0] | bitboards[1]).bit_count() >= bitboard.CELLS - 1
+        best_value = None
+        best_move = None
+        for move_id, (score, winner) in zip(move_ids, self.evaluator.children(bitboards[0], bitboards[1], to_move, move_ids)):
+            if winner == player:
+                score = WIN - ply - 1
+            elif winner == 1 - player:
+                score = ply + 1 - WIN
+            elif solvable:
+                child = self._child(bitboards, to_move, move_id)
+                if child[0] | child[1] == bitboard.FULL:
+                    solved = self.endgame.probe(child[0], child[1], 1 - to_move)
+                    if solved is not None:
+                        score = self._solved_value(solved, 1 - to_move, ply + 1)
+            # the first of equal values is kept
+            if best_value is None or (score > best_value if maximizing else score < best_value):
+                best_value, best_move = score, move_id
+        self.tt.store(key[0], 1, EXACT, _to_tt(best_value, ply), best_move, key[1])
+        return best_value
+
+
+# search of the worker process, kept between tasks so that its table stays warm
+_worker_search = None
+_worker_search_id = None
+
+
+def _init_worker(tt_bits: int, symmetric: bool, endgame: EndgameTable | None) -> None:
+    global _worker_search
+    _worker_search = AlphaBetaSearch(tt_bits=tt_bits, symmetric=symmetric, strict_depth=True, endgame=endgame)
+
+
+def _search_root_move(search_id: int, board0: int, board1: int, to_move: int, move_id: int, depth: int,
+                      alpha: float, deadline: float | None, node_limit: int | None) -> tuple[float | None, int, int]:
+    '''Worker task: returns (value, nodes, cutoffs) of one root move, value being None if the budget ran out'''
+    global _worker_search_id
+    new_search = search_id != _worker_search_id
+    _worker_search_id = search_id
+    value = _worker_search.search_move(board0, board1, to_move, move_id, depth, alpha, deadline, node_limit, new_search)
+    return value, _worker_search.nodes, _worker_search.cutoffs
+
+
+class ParallelSearch(object):
+    '''
+    Iterative deepening that splits the root moves across a pool of worker processes,
+    young brothers wait style: every iteration searches the best move of the previous one
+    first, then all its siblings in parallel against the value of that first move.
+
+    Workers are started on the first search and keep their own transposition tables between
+    moves. Positions are sent as integers. Workers only use table entries of the exact depth
+    searched, so that at a fixed depth the chosen move does not depend on how root moves
+    were scheduled. With a node_limit, each root move search gets that many nodes.
+    '''
+
+    def __init__(self, workers: int, max_depth: int = 4, time_limit: float | None = None, node_limit: int | None = None,
+                 tt_bits: int = 20, symmetric: bool = False, endgame: EndgameTable | None = None) -> None:
+        self.workers = workers
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.tt_bits = tt_bits
+        self.symmetric = symmetric
+        self.endgame = endgame
+        self.nodes = 0
+        self.cutoffs = 0
+        self._pool = None
+        self._search_id = 0
+
+    def search(self, board0: int, board1: int, to_move: int) -> tuple[int | None, float, int]:
+        '''Searches the position and returns (move_id, value, depth), see AlphaBetaSearch.search'''
+        self._search_id += 1
+        self.nodes = 0
+        self.cutoffs = 0
+        deadline = time.time() + self.time_limit if self.time_limit is not None else None
+        bitboards = (board0, board1)
+        moves = unique_move_ids(board0, board1, legal_move_ids(bitboards[1 - to_move]))
+        if not moves:
+            return None, float('-inf'), 0
+
+        # the first iteration is a single frontier, not worth a round trip to the workers
+        first = AlphaBetaSearch(max_depth=1, tt_bits=4, endgame=self.endgame)
+        best = first.search(board0, board1, to_move)
+        self.nodes += first.nodes
+        self.cutoffs += first.cutoffs
+        for depth in range(2, self.max_depth + 1):
+            if abs(best[1]) >= WIN - MAX_PLY:
+                # a forced win or loss does not change with depth
+                break
+            order = (best[0],) + tuple(move_id for move_id in moves if move_id != best[0])
+            try:
+                move_id, value = self._root(board0, board1, to_move, depth, order, deadline)
+            except SearchTimeout:
+                break
+            best = (move_id, value, depth)
+        return best
+
+    def _root(self, board0: int, board1: int, to_move: int, depth: int, order: tuple[int, ...],
+              deadline: float | None) -> tuple[int, float]:
+        pool = self._executor()
+        task = (self._search_id, board0, board1, to_move)
+        # the eldest brother is searched alone with a full window
+        best_move = order[0]
+        alpha = self._result(pool.submit(_search_root_move, *task, best_move, depth, float('-inf'), deadline, self.node_limit))
+        futures = [
+            pool.submit(_search_root_move, *task, move_id, depth, alpha, deadline, self.node_limit)
+            for move_id in order[1:]
+        ]
+        try:
+            values = [self._result(future) for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+        # values above the first one are exact; ties go to the earlier move
+        best_value = alpha
+        for move_id, value in zip(order[1:], values):
+            if value > best_value:
+                best_move, best_value = move_id, value
+        return best_move, best_value
+
+    def _result(self, future) -> float:
+        value, nodes, cutoffs = future.result()
+        self.nodes += nodes
+        self.cutoffs += cutoffs
+        if value is None:
+            raise SearchTimeout()
+        return value
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(self.tt_bits, self.symmetric, self.endgame)
+            )
+        return self._pool
+
+    def close(self) -> None:
+        '''Stops the worker processes'''
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
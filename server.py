@@ -0,0 +1,338 @@
+'''
+Asyncio match server: many games at once in one process, engines on a shared process pool.
+
+Clients speak JSON lines over TCP or a Unix socket. A client opens games with
+
+    {"op": "new", "players": ["alphabeta:max_depth=3", null], "move_time": 5}
+
+where players are tournament.py specs, or null for a seat the client plays itself. The
+server answers {"event": "started", "game": id, "seats": [...]} and from then on sends
+the events of the game: "turn" when a seat of the client is to move, "move" for every
+move played, "illegal" for a rejected one and "over" with the winner, -1 for a draw.
+The client plays with
+
+    {"op": "move", "game": id, "x": 0, "y": 4, "direction": "TOP"}
+
+and can also send {"op": "resign", "game": id} at any time, for its seat or, when it
+holds both, for the seat to move, or {"op": "stats"}. A client that disconnects loses
+its games.
+
+Engine moves run on a process pool shared by all games. Every match seat gets its own
+player, so a search never starts from what it learnt in another game; a worker keeps
+the players of the last WORKER_PLAYERS seats it moved for, so search tables and trees
+stay warm between the moves of a match. Players listed in INLINE are cheap enough to
+run in the event loop. Each move has a deadline: a seat that misses it, or returns more
+than max_illegal illegal moves in a row, loses the game. A worker still busy with a move
+that missed its deadline, or was cut short by a resignation, finishes it, and the result
+is dropped.
+
+    python server.py --port 8765 --workers 4
+'''
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import bitboard
+from game import Game, Move
+from tournament import make_player, parse_player
+
+# players run in the event loop rather than on the pool
+INLINE = {'random'}
+DEFAULT_LIMITS = {'move_time': 10.0, 'max_plies': 1000, 'max_illegal': 100}
+
+# players a worker keeps, the least recently used going first
+WORKER_PLAYERS = 16
+
+# players of the worker process, per (match id, player id), in the order they last moved
+_worker_players = {}
+
+
+def _init_worker() -> None:
+    # forked workers start from the same random state
+    seed = int.from_bytes(os.urandom(4), 'little')
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def _engine_move(spec: str, match_id: int, board0: int, board1: int, to_move: int) -> tuple[int, int, int]:
+    '''Worker task: returns the (x, y, direction) of the move of the spec's player in the seat of to_move'''
+    key = (match_id, to_move)
+    player = _worker_players.pop(key, None)
+    if player is None:
+        player = make_player(*parse_player(spec))
+        if len(_worker_players) >= WORKER_PLAYERS:
+            del _worker_players[next(iter(_worker_players))]
+    _worker_players[key] = player
+    (x, y), slide = player.make_move(Game.from_position(board0, board1, to_move))
+    return x, y, slide.value
+
+
+class Seat(object):
+    '''A side of a match: an engine spec, or None for the client that opened the match'''
+
+    def __init__(self, spec: str | None, connection: 'Connection') -> None:
+        self.spec = spec
+        self.connection = connection
+        self.player = None
+        if spec is not None:
+            name, kwargs = parse_player(spec)
+            if name in INLINE:
+                self.player = make_player(name, kwargs)
+        # move of the client, awaited while it is this seat's turn
+        self.pending = None
+
+
+class Match(object):
+    def __init__(self, match_id: int, seats: list[Seat], limits: dict) -> None:
+        self.id = match_id
+        self.seats = seats
+        self.limits = limits
+        self.game = Game()
+        self.game.current_player_idx = 0
+        self.illegal_moves = [0, 0]
+        self.plies = 0
+        # set to the player id of a resignation, which may come on either turn
+        self.resignation = asyncio.get_running_loop().create_future()
+
+
+class Connection(object):
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer = writer
+        self.matches = {}
+        self.closed = False
+
+    def send(self, event: dict) -> None:
+        if not self.closed:
+            self.writer.write(json.dumps(event).encode() + b'\n')
+
+
+class MatchServer(object):
+    '''
+    workers: processes of the engine pool
+    limits: default move_time (seconds), max_plies and max_illegal of the matches, see Game.play
+    '''
+
+    def __init__(self, workers: int = 1, limits: dict | None = None) -> None:
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._pool = ProcessPoolExecutor(workers, initializer=_init_worker)
+        self._ids = itertools.count(1)
+        self._tasks = set()
+        self.active = 0
+        self.finished = 0
+        self.moves = 0
+        self._start = time.perf_counter()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765, path: str | None = None) -> None:
+        '''Serves on a Unix socket at path if given, otherwise on host:port, until cancelled'''
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._pool.shutdown(cancel_futures=True)
+
+    def stats(self) -> dict:
+        seconds = time.perf_counter() - self._start
+        return {
+            'active': self.active,
+            'finished': self.finished,
+            'moves': self.moves,
+            'seconds': seconds,
+            'games_per_second': self.finished / seconds if seconds > 0 else 0.0,
+            'moves_per_second': self.moves / seconds if seconds > 0 else 0.0,
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = Connection(writer)
+        try:
+            while line := await reader.readline():
+                try:
+                    self._request(connection, json.loads(line))
+                except (ValueError, KeyError, TypeError) as error:
+                    connection.send({'event': 'error', 'message': str(error)})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            connection.closed = True
+            # the client's seats lose their games
+            for match in list(connection.matches.values()):
+                for seat in match.seats:
+                    if seat.pending is not None and not seat.pending.done():
+                        seat.pending.set_result(None)
+            writer.close()
+
+    def _request(self, connection: Connection, request: dict) -> None:
+        op = request['op']
+        if op == 'new':
+            specs = request['players']
+            if len(specs) != 2:
+                raise ValueError('a match needs 2 players')
+            limits = {name: request.get(name, value) for name, value in self.limits.items()}
+            seats = [Seat(spec, connection) for spec in specs]
+            match = Match(next(self._ids), seats, limits)
+            connection.matches[match.id] = match
+            connection.send({'event': 'started', 'game': match.id, 'seats': specs})
+            task = asyncio.create_task(self.run_match(match))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        elif op in ('move', 'resign'):
+            match = connection.matches.get(request['game'])
+            if match is None:
+                raise ValueError(f"no game {request['game']} in progress")
+            player_id = match.game.get_current_player()
+            if op == 'resign':
+                client_ids = [client_id for client_id, seat in enumerate(match.seats) if seat.spec is None]
+                if not client_ids:
+                    raise ValueError(f"no seat of yours in game {match.id}")
+                if not match.resignation.done():
+                    match.resignation.set_result(player_id if len(client_ids) == 2 else client_ids[0])
+                return
+            seat = match.seats[player_id]
+            if seat.spec is not None or seat.pending is None or seat.pending.done():
+                raise ValueError(f"not your turn in game {match.id}")
+            seat.pending.set_result(self._parse_move(request))
+        elif op == 'stats':
+            connection.send({'event': 'stats', **self.stats()})
+        else:
+            raise ValueError(f"unknown op {op!r}")
+
+    @staticmethod
+    def _parse_move(request: dict) -> tuple[tuple[int, int], Move]:
+        '''The move of a move request, ValueError if it is not a cube position and a direction'''
+        x, y, direction = request['x'], request['y'], request['direction']
+        # bool is an int, but not a coordinate
+        for coordinate in (x, y):
+            if type(coordinate) is not int or not 0 <= coordinate < bitboard.SIZE:
+                raise ValueError(f"x and y must be integers from 0 to {bitboard.SIZE - 1}, not {coordinate!r}")
+        if not isinstance(direction, str) or direction not in Move.__members__:
+            raise ValueError(f"direction must be one of {', '.join(Move.__members__)}, not {direction!r}")
+        return (x, y), Move[direction]
+
+    async def run_match(self, match: Match) -> None:
+        '''Plays the match to its end, with the rules of Game.play and its limits'''
+        self.active += 1
+        game = match.game
+        winner, end = -1, None
+        try:
+            while end is None:
+                if match.plies >= match.limits['max_plies']:
+                    end = 'max_plies'
+                    break
+                player_id = game.get_current_player()
+                moving = asyncio.ensure_future(self._move(match, player_id))
+                try:
+                    await asyncio.wait(
+                        (moving, match.resignation), timeout=match.limits['move_time'],
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                finally:
+                    # a move still running is dropped, whatever ended the wait
+                    moving.cancel()
+                if match.resignation.done():
+                    end, winner = 'resign', 1 - match.resignation.result()
+                    break
+                if not moving.done() or moving.cancelled():
+                    move, end = None, 'time'
+                elif moving.exception() is not None:
+                    # a crashing engine loses, the server goes on
+                    move, end = None, 'error'
+                else:
+                    move = moving.result()
+                if move is None:
+                    # _move only gives None for a client that left
+                    end = end or 'disconnect'
+                    winner = 1 - player_id
+                    break
+                try:
+                    token = game.apply(move)
+                except (TypeError, ValueError, AttributeError):
+                    # a malformed move of an engine loses like a crash
+                    end, winner = 'error', 1 - player_id
+                    break
+                if token is None:
+                    match.illegal_moves[player_id] += 1
+                    self._broadcast(match, {'event': 'illegal', 'game': match.id, 'player': player_id})
+                    if match.illegal_moves[player_id] > match.limits['max_illegal']:
+                        end, winner = 'illegal', 1 - player_id
+                    continue
+                match.illegal_moves[player_id] = 0
+                match.plies += 1
+                self.moves += 1
+                (x, y), slide = move
+                self._broadcast(match, {
+                    'event': 'move', 'game': match.id, 'player': player_id, 'x': x, 'y': y, 'direction': slide.name,
+                })
+                winner = game.check_winner(player_id)
+                if winner != -1:
+                    end = 'line'
+        finally:
+            # the players hear of the end whatever stopped the match
+            self.active -= 1
+            self.finished += 1
+            for connection in {seat.connection for seat in match.seats}:
+                connection.matches.pop(match.id, None)
+            self._broadcast(match, {
+                'event': 'over', 'game': match.id, 'winner': winner, 'end': end or 'error', 'plies': match.plies,
+            })
+
+    async def _move(self, match: Match, player_id: int) -> tuple[tuple[int, int], Move] | None:
+        '''The move of the seat to move, None if its client left'''
+        seat = match.seats[player_id]
+        board0, board1 = match.game.get_bitboards()
+        if seat.player is not None:
+            return seat.player.make_move(match.game)
+        if seat.spec is not None:
+            loop = asyncio.get_running_loop()
+            x, y, direction = await loop.run_in_executor(
+                self._pool, _engine_move, seat.spec, match.id, board0, board1, player_id
+            )
+            return (x, y), Move(direction)
+        if seat.connection.closed:
+            return None
+        seat.pending = asyncio.get_running_loop().create_future()
+        seat.connection.send({
+            'event': 'turn', 'game': match.id, 'player': player_id, 'board': match.game.get_board().tolist(),
+        })
+        try:
+            return await seat.pending
+        finally:
+            seat.pending = None
+
+    @staticmethod
+    def _broadcast(match: Match, event: dict) -> None:
+        for connection in {seat.connection for seat in match.seats}:
+            connection.send(event)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quixo match server, JSON lines over a socket')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='path of a Unix socket to serve on instead of TCP')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes running the engines')
+    parser.add_argument('--move-time', type=float, default=DEFAULT_LIMITS['move_time'])
+    parser.add_argument('--max-plies', type=int, default=DEFAULT_LIMITS['max_plies'])
+    parser.add_argument('--max-illegal', type=int, default=DEFAULT_LIMITS['max_illegal'])
+    args = parser.parse_args()
+    server = MatchServer(args.workers, {
+        'move_time': args.move_time, 'max_plies': args.max_plies, 'max_illegal': args.max_illegal,
+    })
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
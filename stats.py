@@ -0,0 +1,103 @@
+'''
+Per-move counters and timings of the players.
+
+Stats are off by default: Player.stats is None and a player only tests it once per move,
+passing None down to its search, which then skips every measurement. enable_stats gives
+the player a Stats, and each make_move fills one MoveStats: the position, counters such
+as nodes or cutoffs, the seconds spent per phase and the total time of the move.
+Hooks are called with every finished move, summary adds the moves up, and summaries of
+several players or games are added up with merge.
+'''
+import json
+import time
+
+import bitboard
+
+
+class MoveStats(object):
+    '''Counters and timings of one move'''
+
+    __slots__ = ('player', 'position', 'counters', 'timings', 'seconds', '_start')
+
+    def __init__(self, player: int, position: int) -> None:
+        self.player = player
+        # packed with bitboard.pack, as Game.apply tokens
+        self.position = position
+        self.counters = {}
+        self.timings = {}
+        self.seconds = 0.0
+        self._start = time.perf_counter()
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        return {
+            'player': self.player,
+            'position': self.position,
+            'seconds': self.seconds,
+            'counters': self.counters,
+            'timings': self.timings,
+        }
+
+
+class Stats(object):
+    '''Moves recorded by a player; hooks are called with each MoveStats once it is finished'''
+
+    def __init__(self, hooks=()) -> None:
+        self.moves = []
+        self.hooks = list(hooks)
+
+    def begin(self, game) -> MoveStats:
+        '''Starts the record of a move from the position of game'''
+        board0, board1 = game.get_bitboards()
+        player = game.get_current_player()
+        return MoveStats(player, bitboard.pack(board0, board1, player))
+
+    def end(self, move: MoveStats) -> None:
+        move.seconds = time.perf_counter() - move._start
+        self.moves.append(move)
+        for hook in self.hooks:
+            hook(move)
+
+    def summary(self) -> dict:
+        '''Totals over the recorded moves'''
+        counters = {}
+        timings = {}
+        for move in self.moves:
+            for name, amount in move.counters.items():
+                counters[name] = counters.get(name, 0) + amount
+            for name, seconds in move.timings.items():
+                timings[name] = timings.get(name, 0.0) + seconds
+        return {
+            'moves': len(self.moves),
+            'seconds': sum(move.seconds for move in self.moves),
+            'max_seconds': max((move.seconds for move in self.moves), default=0.0),
+            'counters': counters,
+            'timings': timings,
+        }
+
+    def export(self, path: str) -> None:
+        '''Appends one JSON line per recorded move to path'''
+        with open(path, 'a') as file:
+            for move in self.moves:
+                file.write(json.dumps(move.as_dict()) + '\n')
+
+    def clear(self) -> None:
+        self.moves = []
+
+
+def merge(summaries) -> dict:
+    '''Adds up summaries of Stats.summary'''
+    merged = {'moves': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'counters': {}, 'timings': {}}
+    for summary in summaries:
+        merged['moves'] += summary['moves']
+        merged['seconds'] += summary['seconds']
+        merged['max_seconds'] = max(merged['max_seconds'], summary['max_seconds'])
+        for field in ('counters', 'timings'):
+            for name, amount in summary[field].items():
+                merged[field][name] = merged[field].get(name, 0) + amount
+    return merged
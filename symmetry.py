@@ -0,0 +1,201 @@
+'''
+The 8 symmetries of the Quixo board (rotations and reflections of the square).
+
+Bitboards are transformed with one table lookup per row, and move ids are mapped
+through precomputed tables, so that a position and its move can be carried into
+any symmetric frame and back.
+
+A symmetric position, such as most positions of the opening, has moves that its
+symmetries map onto each other. Their children are images of one another with the
+same value, so unique_move_ids and unique_move_mask keep one move of each such set
+for the searches to look at.
+'''
+import bitboard
+
+SIZE = bitboard.SIZE
+LAST = SIZE - 1
+
+# each symmetry maps the cube at (X, Y) to a new (X, Y); index 0 is the identity
+_CELL_TRANSFORMS = (
+    lambda x, y: (x, y),
+    lambda x, y: (LAST - y, x),  # rotation by 90 degrees
+    lambda x, y: (LAST - x, LAST - y),  # rotation by 180 degrees
+    lambda x, y: (y, LAST - x),  # rotation by 270 degrees
+    lambda x, y: (LAST - x, y),  # mirror left/right
+    lambda x, y: (x, LAST - y),  # mirror top/bottom
+    lambda x, y: (y, x),  # main diagonal
+    lambda x, y: (LAST - y, LAST - x),  # anti-diagonal
+)
+COUNT = len(_CELL_TRANSFORMS)
+
+# unit vector pointing at the side the taken cube is pushed back in from
+_DIRECTION_VECTORS = {
+    bitboard.TOP: (0, -1),
+    bitboard.BOTTOM: (0, 1),
+    bitboard.LEFT: (-1, 0),
+    bitboard.RIGHT: (1, 0),
+}
+_VECTOR_DIRECTIONS = {vector: direction for direction, vector in _DIRECTION_VECTORS.items()}
+
+
+def _transform_direction(symmetry: int, direction: int) -> int:
+    '''Directions follow the linear part of the symmetry, i.e. the image of the vector around the centre'''
+    dx, dy = _DIRECTION_VECTORS[direction]
+    centre = LAST // 2
+    x, y = _CELL_TRANSFORMS[symmetry](centre + dx, centre + dy)
+    return _VECTOR_DIRECTIONS[(x - centre, y - centre)]
+
+
+def _row_table(symmetry: int) -> tuple[int, ...]:
+    '''Image of every 5-bit pattern of every row, indexed by row * 32 + pattern'''
+    table = []
+    for y in range(SIZE):
+        for pattern in range(1 << SIZE):
+            image = 0
+            for x in range(SIZE):
+                if pattern >> x & 1:
+                    image |= bitboard.bit(*_CELL_TRANSFORMS[symmetry](x, y))
+            table.append(image)
+    return tuple(table)
+
+
+_ROW_TABLES = tuple(_row_table(symmetry) for symmetry in range(COUNT))
+# cells each row is mapped onto, per symmetry
+_ROW_IMAGES = tuple(tuple(table[32 * y + 31] for y in range(SIZE)) for table in _ROW_TABLES)
+
+# MOVE_TRANSFORMS[symmetry][move_id] is the id of the image of the move
+MOVE_TRANSFORMS = tuple(
+    tuple(
+        bitboard.MOVE_INDEX[(*_CELL_TRANSFORMS[symmetry](x, y), _transform_direction(symmetry, direction))]
+        for x, y, direction in bitboard.MOVES
+    )
+    for symmetry in range(COUNT)
+)
+# INVERSE[symmetry] undoes symmetry
+INVERSE = tuple(
+    next(
+        inverse for inverse in range(COUNT)
+        if all(MOVE_TRANSFORMS[inverse][MOVE_TRANSFORMS[symmetry][move_id]] == move_id for move_id in range(len(bitboard.MOVES)))
+    )
+    for symmetry in range(COUNT)
+)
+
+# the symmetries that are their own inverse: the half turn, the mirrors and the diagonals
+_ORDER_TWO = tuple(symmetry for symmetry in range(1, COUNT) if INVERSE[symmetry] == symmetry)
+
+
+def transform(symmetry: int, board: int) -> int:
+    '''Returns the image of a bitboard under symmetry'''
+    table = _ROW_TABLES[symmetry]
+    return (
+        table[board & 31]
+        | table[32 + (board >> 5 & 31)]
+        | table[64 + (board >> 10 & 31)]
+        | table[96 + (board >> 15 & 31)]
+        | table[128 + (board >> 20 & 31)]
+    )
+
+
+def transform_move(symmetry: int, move_id: int) -> int:
+    '''Returns the id of the image of a move under symmetry'''
+    return MOVE_TRANSFORMS[symmetry][move_id]
+
+
+def canonical(board0: int, board1: int) -> tuple[int, int, int]:
+    '''
+    Returns (board0, board1, symmetry): the smallest image of the position over the
+    8 symmetries, and the symmetry that maps the position onto it.
+    '''
+    best0, best1, best_symmetry = board0, board1, 0
+    best = board0 | board1 << bitboard.CELLS
+    for symmetry in range(1, COUNT):
+        image0 = transform(symmetry, board0)
+        image1 = transform(symmetry, board1)
+        packed = image0 | image1 << bitboard.CELLS
+        if packed < best:
+            best, best0, best1, best_symmetry = packed, image0, image1, symmetry
+    return best0, best1, best_symmetry
+
+
+def stabilizer(board0: int, board1: int) -> tuple[int, ...]:
+    '''Returns the symmetries other than the identity that map the position onto itself, () for most positions'''
+    # a subgroup other than the identity holds a symmetry of order 2, so the quarter turns only need a look then
+    for symmetry in _ORDER_TWO:
+        # the image of the top row rejects most positions
+        if (
+            _ROW_TABLES[symmetry][board0 & 31] == board0 & _ROW_IMAGES[symmetry][0]
+            and transform(symmetry, board0) == board0
+            and transform(symmetry, board1) == board1
+        ):
+            break
+    else:
+        return ()
+    return tuple(
+        symmetry for symmetry in range(1, COUNT)
+        if transform(symmetry, board0) == board0 and transform(symmetry, board1) == board1
+    )
+
+
+def unique_move_ids(board0: int, board1: int, move_ids) -> tuple[int, ...]:
+    '''
+    Returns move_ids, in their order, without the moves that a symmetry of the position
+    maps onto an earlier one: the children of those are images of the earlier child.
+    '''
+    symmetries = stabilizer(board0, board1)
+    if not symmetries:
+        return tuple(move_ids)
+    unique = []
+    images = set()
+    for move_id in move_ids:
+        if move_id not in images:
+            unique.append(move_id)
+            images.update(MOVE_TRANSFORMS[symmetry][move_id] for symmetry in symmetries)
+    return tuple(unique)
+
+
+def unique_move_mask(board0: int, board1: int, mask: int) -> int:
+    '''unique_move_ids for a bitmask of move ids, keeping the lowest id of each set of equivalent moves'''
+    symmetries = stabilizer(board0, board1)
+    if not symmetries:
+        return mask
+    unique = 0
+    while mask:
+        move_id = (mask & -mask).bit_length() - 1
+        unique |= 1 << move_id
+        # a symmetry may map the move onto itself, so its own bit is cleared explicitly
+        mask &= ~(1 << move_id)
+        for symmetry in symmetries:
+            mask &= ~(1 << MOVE_TRANSFORMS[symmetry][move_id])
+    return unique
+
+
+def _check(positions: int = 10000, seed: int = 0) -> None:
+    '''
+    Compares stabilizer with a transform of every symmetry, and unique_move_mask with
+    unique_move_ids over the move ids in increasing order, on random positions, half of
+    them made symmetric
+    '''
+    import random
+
+    rng = random.Random(seed)
+    for _ in range(positions):
+        board0 = rng.getrandbits(bitboard.CELLS) & rng.getrandbits(bitboard.CELLS)
+        board1 = rng.getrandbits(bitboard.CELLS) & rng.getrandbits(bitboard.CELLS) & ~board0
+        if rng.random() < 0.5:
+            symmetry = rng.randrange(1, COUNT)
+            board0 |= transform(symmetry, board0)
+            board1 = (board1 | transform(symmetry, board1)) & ~board0
+        expected = tuple(
+            symmetry for symmetry in range(1, COUNT)
+            if transform(symmetry, board0) == board0 and transform(symmetry, board1) == board1
+        )
+        assert stabilizer(board0, board1) == expected, (board0, board1)
+        mask = rng.getrandbits(len(bitboard.MOVES))
+        move_ids = [move_id for move_id in range(len(bitboard.MOVES)) if mask >> move_id & 1]
+        unique = sum(1 << move_id for move_id in unique_move_ids(board0, board1, move_ids))
+        assert unique_move_mask(board0, board1, mask) == unique, (board0, board1, mask)
+    print(f'{positions} positions checked')
+
+
+if __name__ == '__main__':
+    _check()
@@ -0,0 +1,265 @@
+'''
+Tournament runner: plays many games between the players of the scripts on a process pool.
+
+Players are named in PLAYERS and built in the worker processes from their script, so a
+game only sends names, keyword arguments and a seed. Every game has its own seed, the
+player moving first alternates from one game to the next, and several players meet in a
+round robin. Games are written to a JSON lines file as they finish, and the summary gives
+the wins, losses and draws of each player, Elo ratings with 95% confidence intervals and
+the number of games per second. Games are played without output and can be bounded with
+the limits of Game.play (max_plies, repetitions, move_time, max_illegal). With stats, the
+players record the work of their moves, see stats.py, and the summary adds it up per player.
+
+    python tournament.py alphabeta mcts:num_simulations=200 random --games 100 --workers 4
+'''
+import argparse
+import ast
+import contextlib
+import importlib.util
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from game import Game
+from stats import merge
+
+# name -> (script, class)
+PLAYERS = {
+    'random': ('main.py', 'RandomPlayer'),
+    'minimax': ('main.py', 'MyPlayer'),
+    'alphabeta': ('main-with-alpha-beta.py', 'MyPlayer'),
+    'mcts': ('monte-carlo.py', 'MyPlayer'),
+}
+
+_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+_scripts = {}
+
+
+def _load_script(script: str):
+    '''Imports a script by path, as some script names are not valid module names'''
+    module = _scripts.get(script)
+    if module is None:
+        name = os.path.splitext(script)[0].replace('-', '_')
+        spec = importlib.util.spec_from_file_location(name, os.path.join(_DIRECTORY, script))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _scripts[script] = module
+    return module
+
+
+def parse_player(spec: str) -> tuple[str, dict]:
+    '''Parses 'name' or 'name:key=value,key=value' into (name, keyword arguments), values as Python literals'''
+    name, _, arguments = spec.partition(':')
+    if name not in PLAYERS:
+        raise ValueError(f"unknown player {name!r}, expected one of {', '.join(PLAYERS)}")
+    kwargs = {}
+    for argument in filter(None, arguments.split(',')):
+        key, _, value = argument.partition('=')
+        kwargs[key] = ast.literal_eval(value)
+    return name, kwargs
+
+
+def make_player(name: str, kwargs: dict | None = None):
+    script, class_name = PLAYERS[name]
+    return getattr(_load_script(script), class_name)(**(kwargs or {}))
+
+
+def play_game(task: dict) -> dict:
+    '''Plays one game of a task built by schedule and returns its record'''
+    random.seed(task['seed'])
+    np.random.seed(task['seed'] % 2 ** 32)
+    players = [make_player(*entrant) for entrant in task['players']]
+    if task['stats']:
+        for player in players:
+            player.enable_stats()
+    game = Game()
+    start = time.perf_counter()
+    winner = game.play(*players, verbose=False, **task['limits'])
+    record = {
+        'game': task['game'],
+        'seed': task['seed'],
+        'players': task['labels'],
+        'winner': task['labels'][winner] if winner in (0, 1) else None,
+        'end': game.end,
+        'plies': game.plies,
+        'illegal_moves': game.illegal_moves,
+        'seconds': time.perf_counter() - start,
+    }
+    if task['stats']:
+        record['stats'] = [player.stats.summary() for player in players]
+    return record
+
+
+def schedule(entrants: list[str], games: int, seed: int = 0, limits: dict | None = None,
+             stats: bool = False) -> list[dict]:
+    '''
+    Returns the tasks of a round robin between the entrant specs, games per pair, the first
+    player alternating between the two entrants of the pair. limits are keyword arguments of Game.play.
+    '''
+    if len(set(entrants)) != len(entrants):
+        raise ValueError('entrant specs must be distinct')
+    parsed = [parse_player(entrant) for entrant in entrants]
+    tasks = []
+    for first, second in itertools.combinations(range(len(entrants)), 2):
+        for index in range(games):
+            pair = (first, second) if index % 2 == 0 else (second, first)
+            tasks.append({
+                'game': len(tasks),
+                'seed': seed * 1_000_003 + len(tasks),
+                'players': [parsed[entrant] for entrant in pair],
+                'labels': [entrants[entrant] for entrant in pair],
+                'limits': limits or {},
+                'stats': stats,
+            })
+    return tasks
+
+
+def elo(records: list[dict], entrants: list[str], iterations: int = 200) -> dict[str, tuple[float, float]]:
+    '''
+    Fits Elo ratings to the game records, a draw counting half a win for each side, and
+    returns {entrant: (rating, half width of the 95% interval)}. Ratings average 0.
+    '''
+    index = {entrant: position for position, entrant in enumerate(entrants)}
+    count = len(entrants)
+    games = np.zeros((count, count))
+    scores = np.zeros((count, count))
+    for record in records:
+        a, b = (index[label] for label in record['players'])
+        games[a, b] += 1
+        games[b, a] += 1
+        if record['winner'] is None:
+            scores[a, b] += 0.5
+            scores[b, a] += 0.5
+        else:
+            winner = index[record['winner']]
+            scores[winner, b if winner == a else a] += 1
+
+    # Bradley-Terry strengths by minorization-maximization; perfect scores are kept finite
+    wins = np.clip(scores.sum(axis=1), 0.5, np.maximum(games.sum(axis=1) - 0.5, 0.5))
+    strengths = np.ones(count)
+    for _ in range(iterations):
+        pair_sums = strengths[:, None] + strengths[None, :]
+        strengths = wins / np.maximum((games / pair_sums).sum(axis=1), 1e-12)
+        strengths /= np.exp(np.log(strengths).mean())
+    ratings = 400 * np.log10(strengths)
+
+    # standard error from the Fisher information of each rating, the others being fixed
+    expected = 1 / (1 + 10 ** ((ratings[None, :] - ratings[:, None]) / 400))
+    information = (games * expected * (1 - expected)).sum(axis=1) * (math.log(10) / 400) ** 2
+    errors = np.where(information > 0, 1 / np.sqrt(np.maximum(information, 1e-12)), np.inf)
+    return {entrant: (float(ratings[i]), float(1.96 * errors[i])) for i, entrant in enumerate(entrants)}
+
+
+def summarize(records: list[dict], entrants: list[str], seconds: float) -> dict:
+    results = {entrant: {'wins': 0, 'losses': 0, 'draws': 0} for entrant in entrants}
+    for record in records:
+        for label in record['players']:
+            if record['winner'] is None:
+                results[label]['draws'] += 1
+            elif record['winner'] == label:
+                results[label]['wins'] += 1
+            else:
+                results[label]['losses'] += 1
+    for entrant, (rating, interval) in elo(records, entrants).items():
+        results[entrant]['elo'] = rating
+        results[entrant]['elo_95'] = interval
+    if any('stats' in record for record in records):
+        for entrant in entrants:
+            results[entrant]['stats'] = merge(
+                summary
+                for record in records if 'stats' in record
+                for label, summary in zip(record['players'], record['stats']) if label == entrant
+            )
+    return {
+        'games': len(records),
+        'seconds': seconds,
+        'games_per_second': len(records) / seconds if seconds > 0 else float('inf'),
+        'players': results,
+    }
+
+
+def run(
+    entrants: list[str],
+    games: int = 100,
+    workers: int = 1,
+    seed: int = 0,
+    out: str | None = None,
+    stats: bool = False,
+    **limits,
+) -> dict:
+    '''
+    Plays a round robin between the entrant specs, see parse_player, and returns its summary.
+    With out, every game record is appended to that JSON lines file as soon as it finishes.
+    stats: record the work of every move and add it to the records and the summary
+    limits are passed on to Game.play, e.g. max_plies=500.
+    '''
+    tasks = schedule(entrants, games, seed, limits, stats)
+    records = []
+    start = time.perf_counter()
+    with open(out, 'a') if out is not None else contextlib.nullcontext() as file:
+        def collect(record):
+            records.append(record)
+            if file is not None:
+                file.write(json.dumps(record) + '\n')
+                file.flush()
+
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                futures = [pool.submit(play_game, task) for task in tasks]
+                try:
+                    for future in as_completed(futures):
+                        collect(future.result())
+                except BaseException:
+                    # leaving the block waits for the pool, which would play every game still queued
+                    pool.shutdown(cancel_futures=True)
+                    raise
+        else:
+            for task in tasks:
+                collect(play_game(task))
+    return summarize(records, entrants, time.perf_counter() - start)
+
+
+def _print_summary(summary: dict) -> None:
+    print(f"{summary['games']} games in {summary['seconds']:.1f}s, {summary['games_per_second']:.2f} games/s")
+    print(f"{'player':<32} {'wins':>6} {'losses':>6} {'draws':>6} {'elo':>12}")
+    ranking = sorted(summary['players'].items(), key=lambda item: item[1]['elo'], reverse=True)
+    for entrant, result in ranking:
+        print(
+            f"{entrant:<32} {result['wins']:>6} {result['losses']:>6} {result['draws']:>6} "
+            f"{result['elo']:>6.0f} ± {result['elo_95']:.0f}"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Round robin between Quixo players')
+    parser.add_argument('players', nargs='+', help=f"name[:key=value,...], names: {', '.join(PLAYERS)}")
+    parser.add_argument('--games', type=int, default=100, help='games per pair of players')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes playing games')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='JSON lines file the game records are appended to')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    parser.add_argument('--stats', action='store_true', help='record the work of the players, see stats.py')
+    parser.add_argument('--max-plies', type=int, help='moves after which a game is drawn')
+    parser.add_argument('--repetitions', type=int, help='occurrences of a position that draw a game')
+    parser.add_argument('--move-time', type=float, help='seconds per move, a slower player loses')
+    parser.add_argument('--max-illegal', type=int, help='illegal moves in a row after which a player loses')
+    args = parser.parse_args()
+    if len(args.players) < 2:
+        sys.exit('a tournament needs at least 2 players')
+    limits = {
+        name: getattr(args, name)
+        for name in ('max_plies', 'repetitions', 'move_time', 'max_illegal')
+        if getattr(args, name) is not None
+    }
+    summary = run(args.players, args.games, args.workers, args.seed, args.out, args.stats, **limits)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        _print_summary(summary)
@@ -0,0 +1,138 @@
+'''
+Zobrist hashing and a bounded transposition table for the search players.
+
+A position key XORs one random 64-bit number per (player, cube) plus one for the side
+to move. The numbers are grouped per row, so a key is 10 table lookups and a move,
+which only changes the rows it slides through, updates it with a few more.
+'''
+import random
+from typing import NamedTuple
+
+import bitboard
+import symmetry
+
+# bound types of a stored value
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+_ROW_PATTERNS = 1 << bitboard.SIZE
+
+
+def _zobrist_rows(rng: random.Random) -> tuple[int, ...]:
+    '''XOR of the cube keys of every row pattern, indexed by row * 32 + pattern'''
+    table = []
+    for _ in range(bitboard.SIZE):
+        cube_keys = [rng.getrandbits(64) for _ in range(bitboard.SIZE)]
+        for pattern in range(_ROW_PATTERNS):
+            key = 0
+            for x in range(bitboard.SIZE):
+                if pattern >> x & 1:
+                    key ^= cube_keys[x]
+            table.append(key)
+    return tuple(table)
+
+
+# fixed seed, so keys are the same in every process
+_rng = random.Random(0x5158)
+_ZOBRIST = (_zobrist_rows(_rng), _zobrist_rows(_rng))
+_SIDE = (0, _rng.getrandbits(64))
+_ROW_SHIFTS = tuple(range(0, bitboard.CELLS, bitboard.SIZE))
+
+
+def zobrist(board0: int, board1: int, to_move: int) -> int:
+    '''Returns the Zobrist key of a position'''
+    zobrist0, zobrist1 = _ZOBRIST
+    key = _SIDE[to_move]
+    for row, shift in enumerate(_ROW_SHIFTS):
+        offset = row * _ROW_PATTERNS
+        key ^= zobrist0[offset + (board0 >> shift & 31)] ^ zobrist1[offset + (board1 >> shift & 31)]
+    return key
+
+
+def update_zobrist(key: int, before: tuple[int, int], after: tuple[int, int]) -> int:
+    '''
+    Returns the key after a move from the key before it, given the (player 0, player 1)
+    bitboards before and after. Only the rows the move changed are rehashed.
+    '''
+    zobrist0, zobrist1 = _ZOBRIST
+    changed = (before[0] ^ after[0]) | (before[1] ^ after[1])
+    for row, shift in enumerate(_ROW_SHIFTS):
+        if changed >> shift & 31:
+            offset = row * _ROW_PATTERNS
+            key ^= (
+                zobrist0[offset + (before[0] >> shift & 31)] ^ zobrist0[offset + (after[0] >> shift & 31)]
+                ^ zobrist1[offset + (before[1] >> shift & 31)] ^ zobrist1[offset + (after[1] >> shift & 31)]
+            )
+    # the side to move always changes
+    return key ^ _SIDE[1]
+
+
+class Entry(NamedTuple):
+    key: int
+    depth: int
+    flag: int
+    value: float
+    move_id: int | None
+    generation: int
+
+
+class TranspositionTable(object):
+    '''
+    Fixed-size table of search results indexed by the low bits of the position key.
+    A slot is overwritten by a search of the same position, by a search at least as deep,
+    or when it was filled during an earlier call to new_search.
+
+    With symmetric=True, positions are folded under the 8 board symmetries: keys are those of
+    the canonical position and stored moves are mapped to and from the canonical frame.
+    '''
+
+    def __init__(self, size_bits: int = 20, symmetric: bool = False) -> None:
+        self.symmetric = symmetric
+        self._mask = (1 << size_bits) - 1
+        self._slots: list[Entry | None] = [None] * (1 << size_bits)
+        self._generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def key(self, board0: int, board1: int, to_move: int) -> tuple[int, int]:
+        '''Returns the (key, symmetry) of a position; symmetry is 0 unless the table is symmetric'''
+        if not self.symmetric:
+            return zobrist(board0, board1, to_move), 0
+        board0, board1, position_symmetry = symmetry.canonical(board0, board1)
+        return zobrist(board0, board1, to_move), position_symmetry
+
+    def child_key(self, key: int, before: tuple[int, int], after: tuple[int, int], to_move: int) -> tuple[int, int]:
+        '''Returns the (key, symmetry) after a move, updated incrementally unless the table is symmetric'''
+        if not self.symmetric:
+            return update_zobrist(key, before, after), 0
+        return self.key(after[0], after[1], to_move)
+
+    def probe(self, key: int, position_symmetry: int = 0) -> Entry | None:
+        '''Returns the entry stored for the position, with its move in the position's frame'''
+        self.probes += 1
+        entry = self._slots[key & self._mask]
+        if entry is None or entry.key != key:
+            return None
+        self.hits += 1
+        if position_symmetry and entry.move_id is not None:
+            entry = entry._replace(move_id=symmetry.transform_move(symmetry.INVERSE[position_symmetry], entry.move_id))
+        return entry
+
+    def store(self, key: int, depth: int, flag: int, value: float, move_id: int | None = None, position_symmetry: int = 0) -> None:
+        '''Stores a search result, move_id being in the position's frame'''
+        index = key & self._mask
+        entry = self._slots[index]
+        if entry is not None and entry.key != key and entry.generation == self._generation and entry.depth > depth:
+            return
+        if position_symmetry and move_id is not None:
+            move_id = symmetry.transform_move(position_symmetry, move_id)
+        self._slots[index] = Entry(key, depth, flag, value, move_id, self._generation)
+
+    def new_search(self) -> None:
+        '''Ages the stored entries, so that they can be replaced by the next search'''
+        self._generation += 1
+
+    def clear(self) -> None:
+        # probes and hits keep counting, so differences between two moments stay meaningful
+        self._slots = [None] * len(self._slots)
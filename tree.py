@@ -0,0 +1,189 @@
+'''
+Array-backed storage for the Monte Carlo search tree.
+
+Nodes are indices into one NumPy array per field, so a node costs a few dozen bytes
+instead of a Python object with its own lists. The root is node 0. The children of a
+node are contiguous and in the order they were expanded: they live in a block of
+slots that starts with room for 2 and moves to the end of the arrays with twice the
+room when full, up to one slot per legal move. Moving a block keeps the rank of
+every child in it, so a node can be found again from the ranks along its path. The
+moves not expanded yet are a bitmask of move ids; of the moves that a symmetry of the
+position maps onto each other only one is there, as their children would be images of
+each other. A node where the game is over has none.
+
+A node stores its position packed with bitboard.pack, the format of Game.apply
+tokens, so rollouts start from a node without replaying moves.
+'''
+import numpy as np
+
+import bitboard
+from movegen import legal_move_mask
+from symmetry import unique_move_mask
+
+ROOT = 0
+# parent of the root
+NO_NODE = -1
+
+_FIELDS = (
+    ('visits', np.int32),
+    ('wins', np.int32),
+    ('parent', np.int32),
+    ('move_id', np.int8),
+    ('depth', np.int16),
+    ('position', np.int64),
+    ('untried', np.int64),
+    ('first_child', np.int32),
+    ('child_count', np.int8),
+)
+# bytes per node
+NODE_SIZE = sum(np.dtype(dtype).itemsize for _, dtype in _FIELDS)
+
+
+def _block_size(count: int, legal: int) -> int:
+    '''Slots of a block holding count children out of legal moves'''
+    if count == 0:
+        return 0
+    return min(legal, max(2, 1 << (count - 1).bit_length()))
+
+
+class Tree(object):
+    '''
+    Tree of the positions reached from (board0, board1, to_move).
+    Arrays start with capacity slots and double when full.
+    '''
+
+    def __init__(self, board0: int, board1: int, to_move: int, capacity: int = 1024) -> None:
+        for name, dtype in _FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.size = 0
+        self._reserve(1)
+        self._init_node(ROOT, NO_NODE, -1, 0, bitboard.pack(board0, board1, to_move))
+
+    @property
+    def nbytes(self) -> int:
+        '''Memory held by the arrays, reserved slots included'''
+        return sum(getattr(self, name).nbytes for name, _ in _FIELDS)
+
+    def to_move(self, node: int) -> int:
+        return bitboard.unpack(int(self.position[node]))[2]
+
+    def board(self, node: int) -> tuple[int, int, int]:
+        '''Returns the (board0, board1, to_move) of node'''
+        return bitboard.unpack(int(self.position[node]))
+
+    def winner(self, node: int) -> int:
+        '''The winner of the game at node, -1 while it goes on'''
+        board0, board1, to_move = bitboard.unpack(int(self.position[node]))
+        # the player who is not to move made the last move
+        return bitboard.winner(board0, board1, 1 - to_move)
+
+    def children(self, node: int) -> range:
+        first = int(self.first_child[node])
+        return range(first, first + int(self.child_count[node]))
+
+    def add_child(self, node: int, move_id: int) -> int:
+        '''Expands the untried move_id of node and returns the new child'''
+        untried = int(self.untried[node])
+        count = int(self.child_count[node])
+        legal = count + untried.bit_count()
+        if _block_size(count + 1, legal) > _block_size(count, legal):
+            self._move_block(node, _block_size(count + 1, legal))
+        child = int(self.first_child[node]) + count
+        self.child_count[node] = count + 1
+        self.untried[node] = untried & ~(1 << move_id)
+
+        position = bitboard.apply_packed(int(self.position[node]), move_id)
+        self._init_node(child, node, move_id, int(self.depth[node]) + 1, position)
+        return child
+
+    def path(self, node: int) -> tuple[int, ...]:
+        '''Returns the ranks of the nodes from the root to node in their blocks, see follow'''
+        ranks = []
+        while node != ROOT:
+            parent = int(self.parent[node])
+            ranks.append(node - int(self.first_child[parent]))
+            node = parent
+        return tuple(reversed(ranks))
+
+    def follow(self, path: tuple[int, ...]) -> int:
+        '''Returns the node at the end of path, wherever its block has moved since'''
+        node = ROOT
+        for rank in path:
+            node = int(self.first_child[node]) + rank
+        return node
+
+    def subtree(self, node: int) -> 'Tree':
+        '''Returns a copy of the subtree of node, node becoming the root; the rest is left behind'''
+        # breadth-first order keeps every block of children contiguous; -1 marks the reserved slots
+        order = [node]
+        first_child = [0]
+        index = 0
+        while index < len(order):
+            current = order[index]
+            if current != -1 and self.child_count[current]:
+                first_child[index] = len(order)
+                count = int(self.child_count[current])
+                order.extend(self.children(current))
+                order.extend([-1] * (_block_size(count, count + int(self.untried[current]).bit_count()) - count))
+                first_child.extend([0] * (len(order) - len(first_child)))
+            index += 1
+
+        order = np.array(order, dtype=np.int64)
+        used = order != -1
+        tree = Tree.__new__(Tree)
+        for name, dtype in _FIELDS:
+            values = np.zeros(len(order), dtype=dtype)
+            values[used] = getattr(self, name)[order[used]]
+            setattr(tree, name, values)
+        tree.size = len(order)
+        # old index -> new index, for the parent links
+        renumber = np.full(self.size, NO_NODE, dtype=np.int32)
+        renumber[order[used]] = np.flatnonzero(used)
+        tree.parent[used] = np.where(tree.parent[used] >= 0, renumber[tree.parent[used]], NO_NODE)
+        tree.parent[ROOT] = NO_NODE
+        tree.first_child[:] = first_child
+        tree.depth[used] -= tree.depth[ROOT]
+        return tree
+
+    def _move_block(self, node: int, size: int) -> None:
+        '''Moves the children of node to a new block of size slots'''
+        first = int(self.first_child[node])
+        count = int(self.child_count[node])
+        start = self._reserve(size)
+        for name, _ in _FIELDS:
+            values = getattr(self, name)
+            values[start:start + count] = values[first:first + count]
+        for rank in range(count):
+            child = start + rank
+            if self.child_count[child]:
+                self.parent[self.children(child)] = child
+        self.first_child[node] = start
+
+    def _reserve(self, count: int) -> int:
+        start = self.size
+        self.size += count
+        capacity = len(self.visits)
+        if self.size > capacity:
+            while capacity < self.size:
+                capacity *= 2
+            for name, _ in _FIELDS:
+                values = getattr(self, name)
+                grown = np.zeros(capacity, dtype=values.dtype)
+                grown[:start] = values[:start]
+                setattr(self, name, grown)
+        return start
+
+    def _init_node(self, node: int, parent: int, move_id: int, depth: int, position: int) -> None:
+        board0, board1, to_move = bitboard.unpack(position)
+        self.visits[node] = 0
+        self.wins[node] = 0
+        self.parent[node] = parent
+        self.move_id[node] = move_id
+        self.depth[node] = depth
+        self.position[node] = position
+        if bitboard.winner(board0, board1, 1 - to_move) != -1:
+            # the game is over, there is nothing to expand
+            self.untried[node] = 0
+        else:
+            self.untried[node] = unique_move_mask(board0, board1, legal_move_mask((board0, board1)[1 - to_move]))
+        self.child_count[node] = 0
@@ -0,0 +1,212 @@
+'''
+Vectorized Quixo: N games stepped in lockstep on arrays of bitboards.
+
+The games live in int64 arrays of bitboards, one entry per game, with the player to
+move and the plies played. A step applies one move per game through the move tables
+of bitboard.py turned into arrays, so a step is a few NumPy operations whatever N is.
+It then finds the winners of all the games at once and starts finished games again
+from the empty board. Random legal moves are drawn for all the games at once too.
+
+evaluate plays a policy against another over many games this way. A policy maps
+(env, games) to move ids for these games, so random_policy or any vectorized policy
+can be plugged in.
+
+    python vecenv.py 100000 4096
+
+`python vecenv.py --check` replays random games move by move on Game and compares
+every step.
+'''
+import sys
+import time
+
+import numpy as np
+
+import bitboard
+
+# plies after which a game is drawn
+MAX_PLIES = 200
+
+KEEP, SEGMENT, SHL, SHR, DESTINATION = (np.array(column, dtype=np.int64) for column in zip(*bitboard._APPLY))
+SOURCE = np.array(bitboard.SOURCE, dtype=np.int64)
+
+
+class VecEnv(object):
+    '''
+    count games, each drawn once max_plies pass without a winner.
+    seed seeds the generator of random_moves.
+    '''
+
+    def __init__(self, count: int, max_plies: int = MAX_PLIES, seed: int | None = None) -> None:
+        self.count = count
+        self.max_plies = max_plies
+        self.rng = np.random.default_rng(seed)
+        self.board0 = np.zeros(count, dtype=np.int64)
+        self.board1 = np.zeros(count, dtype=np.int64)
+        self.to_move = np.zeros(count, dtype=np.int8)
+        self.plies = np.zeros(count, dtype=np.int32)
+
+    def reset(self, games: np.ndarray | None = None) -> None:
+        '''Starts the games again from the empty board, all of them by default'''
+        games = slice(None) if games is None else games
+        self.board0[games] = 0
+        self.board1[games] = 0
+        self.to_move[games] = 0
+        self.plies[games] = 0
+
+    def boards(self) -> np.ndarray:
+        '''The boards as an (N, 5, 5) int8 array: -1 neutral, 0 and 1 the players' cubes'''
+        shifts = np.arange(bitboard.CELLS, dtype=np.int64)
+        cells0 = (self.board0[:, None] >> shifts) & 1
+        cells1 = (self.board1[:, None] >> shifts) & 1
+        boards = np.where(cells0 == 1, 0, np.where(cells1 == 1, 1, -1)).astype(np.int8)
+        return boards.reshape(self.count, bitboard.SIZE, bitboard.SIZE)
+
+    def movers(self) -> tuple[np.ndarray, np.ndarray]:
+        '''Returns the bitboards of the players to move and of their opponents'''
+        first = self.to_move == 0
+        return np.where(first, self.board0, self.board1), np.where(first, self.board1, self.board0)
+
+    def legal_moves(self) -> np.ndarray:
+        '''(N, 44) array, True where the move is legal in the game'''
+        _, opponent = self.movers()
+        return (opponent[:, None] & SOURCE) == 0
+
+    def random_moves(self, games: np.ndarray | None = None) -> np.ndarray:
+        '''A uniformly random legal move id per game, for the given games or all of them; -1 without one'''
+        legal = self.legal_moves()
+        if games is not None:
+            legal = legal[games]
+        # the largest of uniform keys over the legal moves is a uniform choice among them
+        keys = np.where(legal, self.rng.random(legal.shape), -1.0)
+        moves = keys.argmax(axis=1)
+        return np.where(legal.any(axis=1), moves, -1)
+
+    def step(self, move_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Plays one legal move id per game and returns (winners, done): the winner of every game,
+        -1 for none or a draw, and whether it is over. A move id of -1, a game without a legal
+        move, loses it. Finished games are reset, so their next step starts a new game.
+        '''
+        move_ids = np.asarray(move_ids, dtype=np.int64)
+        stuck = move_ids < 0
+        moves = np.where(stuck, 0, move_ids)
+        before_mover, before_opponent = self.movers()
+        keep, segment, shl, shr = KEEP[moves], SEGMENT[moves], SHL[moves], SHR[moves]
+        mover = (before_mover & keep) | (((before_mover & segment) << shl) >> shr) | DESTINATION[moves]
+        opponent = (before_opponent & keep) | (((before_opponent & segment) << shl) >> shr)
+        mover = np.where(stuck, before_mover, mover)
+        opponent = np.where(stuck, before_opponent, opponent)
+
+        first = self.to_move == 0
+        self.board0 = np.where(first, mover, opponent)
+        self.board1 = np.where(first, opponent, mover)
+        self.plies += 1
+
+        # completing a line for the opponent loses, even with one of the mover's own
+        to_move = self.to_move.astype(np.int64)
+        opponent_line = bitboard.has_lines(opponent) | stuck
+        mover_line = bitboard.has_lines(mover) & ~opponent_line
+        winners = np.where(opponent_line, 1 - to_move, np.where(mover_line, to_move, -1))
+        done = opponent_line | mover_line | (self.plies >= self.max_plies)
+
+        self.to_move = (1 - to_move).astype(np.int8)
+        if done.any():
+            self.reset(done)
+        return winners, done
+
+
+def random_policy(env: VecEnv, games: np.ndarray) -> np.ndarray:
+    '''Uniformly random legal moves'''
+    return env.random_moves(games)
+
+
+def evaluate(policy, opponent=random_policy, games: int = 10000, envs: int = 1024, max_plies: int = MAX_PLIES,
+             seed: int | None = None) -> dict:
+    '''
+    Plays games between policy and opponent on envs games at a time, the policy moving first in
+    every other game, and returns the wins, losses and draws of the policy with the games per second.
+    '''
+    env = VecEnv(envs, max_plies, seed)
+    # player of the policy in each game; it alternates when a game is started again
+    policy_player = np.arange(envs, dtype=np.int8) % 2
+    # games started, the envs past the count are left to finish and then ignored
+    counted = np.arange(envs) < games
+    started = int(np.count_nonzero(counted))
+    results = {'wins': 0, 'losses': 0, 'draws': 0}
+    finished = 0
+    start = time.perf_counter()
+    while finished < games:
+        policy_turn = env.to_move == policy_player
+        move_ids = np.empty(envs, dtype=np.int64)
+        if policy_turn.any():
+            move_ids[policy_turn] = policy(env, np.flatnonzero(policy_turn))
+        if not policy_turn.all():
+            move_ids[~policy_turn] = opponent(env, np.flatnonzero(~policy_turn))
+        winners, done = env.step(move_ids)
+
+        ended = done & counted
+        if ended.any():
+            ended_winners = winners[ended]
+            ended_players = policy_player[ended]
+            results['wins'] += int(np.count_nonzero(ended_winners == ended_players))
+            results['losses'] += int(np.count_nonzero(ended_winners == 1 - ended_players))
+            results['draws'] += int(np.count_nonzero(ended_winners == -1))
+            finished += int(np.count_nonzero(ended))
+        restarted = np.flatnonzero(done)
+        policy_player[restarted] = 1 - policy_player[restarted]
+        # only the games still needed are counted
+        needed = np.arange(1, len(restarted) + 1) <= games - started
+        counted[restarted] = needed
+        started += int(np.count_nonzero(needed))
+    seconds = time.perf_counter() - start
+    return {**results, 'games': finished, 'seconds': seconds, 'games_per_second': finished / seconds}
+
+
+def _check(count: int = 1000, steps: int = 500, max_plies: int = 60, seed: int = 0) -> None:
+    '''
+    Steps count random games for steps plies and plays the same moves on a Game per game, the
+    scalar engine of the players: the legal moves before every step, the winner, the end of
+    the game and the position after it must agree, and finished games must start again
+    from the empty board
+    '''
+    from game import Game
+    from movegen import MOVES, legal_move_ids
+
+    env = VecEnv(count, max_plies, seed)
+    games = [Game.from_position(0, 0, 0) for _ in range(count)]
+    plies = [0] * count
+    for _ in range(steps):
+        legal = env.legal_moves()
+        move_ids = env.random_moves()
+        winners, done = env.step(move_ids)
+        for index, game in enumerate(games):
+            mover = game.get_current_player()
+            expected = legal_move_ids(game.get_bitboards()[1 - mover])
+            assert tuple(np.flatnonzero(legal[index])) == expected, index
+            move_id = int(move_ids[index])
+            if move_id == -1:
+                assert not expected, index
+                winner = 1 - mover
+            else:
+                assert game.apply(MOVES[move_id]) is not None, (index, move_id)
+                winner = game.check_winner(mover)
+            plies[index] += 1
+            ended = winner != -1 or plies[index] >= max_plies
+            assert (int(winners[index]), bool(done[index])) == (winner, ended), index
+            if ended:
+                games[index] = game = Game.from_position(0, 0, 0)
+                plies[index] = 0
+            position = (*game.get_bitboards(), game.get_current_player())
+            assert (int(env.board0[index]), int(env.board1[index]), int(env.to_move[index])) == position, index
+    print(f'{count} games checked over {steps} steps')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--check']:
+        _check()
+    else:
+        games = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+        envs = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+        result = evaluate(random_policy, random_policy, games, envs, seed=0)
+        print(f"{result['games']} random games in {result['seconds']:.1f}s, {result['games_per_second'] * 60:.0f} games/min")
+        print(f"first policy: {result['wins']} wins, {result['losses']} losses, {result['draws']} draws")